@@ -0,0 +1,131 @@
+from timeit import default_timer as timer
+import argparse
+import json
+import multiprocessing
+import os
+import eliza_logic
+
+def solve_deal(task):
+	""" Pool worker: solve one deal and describe how it went. 'task' is (deal, options), where the deal is a seed
+	(int) or a hash in the exact_setup format (str), and the options go to the search strategy. """
+
+	deal, options = task
+	options = dict(options)
+	strategy = options.pop("strategy", "greedy")
+
+	# The batch already keeps every core busy, so a portfolio per deal would only fight over them
+	options.pop("portfolio", None)
+	options.pop("workers", None)
+	optimize = options.pop("optimize", 0)
+	optimize_depth = options.pop("optimize_depth", 0)
+
+	board = deal_board(deal)
+	searcher = eliza_logic.STRATEGIES[strategy](**options)
+	begin = timer()
+	result = searcher.solve(board)
+	moves = result.moves if result.status == "solved" else None
+	if optimize and moves is not None:
+		moves = eliza_logic.optimize_solution(board, moves, optimize_depth)
+	seconds = timer() - begin
+
+	status = "timeout" if result.status == "budget" else result.status
+	return {"deal": deal, "status": status, "moves": len(moves) if moves is not None else None, "nodes": searcher.nodes_expanded,
+		"seconds": round(seconds, 4), "solution": moves}
+
+def deal_board(deal):
+	""" Board for a seed (int) or an exact_setup hash (str). """
+	if isinstance(deal, int):
+		return eliza_logic.seeded_game(deal).board()
+
+	return eliza_logic.Board.from_hash(deal)
+
+def finished_deals(filename):
+	""" Deals that already have a result in 'filename', so a killed run can pick up where it stopped. """
+	done = set()
+	if not os.path.exists(filename):
+		return done
+
+	with open(filename) as results:
+		for line in results:
+			# A run killed mid-write can leave half a line at the end; that deal just gets solved again
+			try:
+				done.add(json.loads(line)["deal"])
+			except (ValueError, KeyError):
+				continue
+
+	return done
+
+def read_hashes(filename):
+	""" One exact_setup hash per line; blank lines and # comments are skipped. """
+	with open(filename) as hashes:
+		return [line.strip() for line in hashes if line.strip() and not line.startswith("#")]
+
+def solve_batch(deals, filename, processes = None, time_limit = 30, **options):
+	""" Solve many deals across a process pool, appending one JSON line per deal to 'filename' as each finishes.
+	Deals already in the file are skipped. 'time_limit' is seconds per deal (0 for none); 'options' go to the
+	search strategy, except a SolutionCache under "cache", which gets every solution found. Returns the new results. """
+
+	done = finished_deals(filename)
+	todo = [deal for deal in deals if deal not in done]
+	print("%d deals, %d already done, %d to solve." % (len(deals), len(deals) - len(todo), len(todo)))
+
+	options["time_limit"] = time_limit
+	cache = options.pop("cache", None)
+	results = []
+	begin = timer()
+	pool = multiprocessing.Pool(processes)
+	try:
+		with open(filename, "a") as output:
+			# Don't glue the first new result onto a half-written line from a killed run
+			if output.tell() and open(filename, "rb").read()[-1:] != b"\n":
+				output.write("\n")
+
+			for result in pool.imap_unordered(solve_deal, [(deal, options) for deal in todo]):
+				output.write(json.dumps(result) + "\n")
+				output.flush()
+				results.append(result)
+				if cache is not None and result["solution"] is not None:
+					cache.put(deal_board(result["deal"]), result["solution"])
+				moves_text = ", %d moves" % result["moves"] if result["moves"] is not None else ""
+				print("%s: %s%s, %d nodes, %.2f seconds" % (result["deal"], result["status"], moves_text, result["nodes"], result["seconds"]))
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
+
+	elapsed = timer() - begin
+	counts = dict([(status, sum([1 for r in results if r["status"] == status])) for status in ("solved", "unsolvable", "timeout", "not_found")])
+	print("%d solved, %d unsolvable, %d timed out, %d not found in %.2f seconds (%.1f deals/sec)" % (counts["solved"], counts["unsolvable"], counts["timeout"],
+		counts["not_found"], elapsed, len(results) / max(elapsed, 1e-9)))
+
+	# Only meaningful with a strategy that proves unsolvability (like prove), and when few deals time out
+	decided = counts["solved"] + counts["unsolvable"]
+	if decided:
+		print("Solvable rate %.1f%% of %d decided deals" % (100.0 * counts["solved"] / decided, decided))
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "Solve many Eliza solitaire deals in parallel, streaming results to a JSONL file.")
+	parser.add_argument("seeds", nargs = "?", help = "seed range like 0-999")
+	parser.add_argument("--hashes", help = "file of exact_setup hashes, one per line, instead of seeds")
+	parser.add_argument("-o", "--output", default = "results.jsonl", help = "JSONL file to append results to (default: results.jsonl)")
+	parser.add_argument("-j", "--workers", type = int, default = None, help = "worker processes (default: one per core)")
+	eliza_logic.add_solver_arguments(parser)
+	# Unlike a single solve, a batch shouldn't sit on one deal forever by default
+	parser.set_defaults(time_limit = 30)
+	args = parser.parse_args()
+
+	if args.hashes:
+		deals = read_hashes(args.hashes)
+	elif args.seeds:
+		deals = list(eliza_logic.parse_seeds(args.seeds))
+	else:
+		parser.error("give a seed range or --hashes")
+
+	# Pool workers can't start pools of their own, and the batch already keeps every core busy anyway
+	if args.strategy == "parallel":
+		parser.error("the parallel strategy can't be used inside a batch")
+
+	options = eliza_logic.solver_options(args)
+	time_limit = options.pop("time_limit")
+	solve_batch(deals, args.output, args.workers, time_limit, **options)
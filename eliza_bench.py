@@ -0,0 +1,322 @@
+from timeit import default_timer as timer
+import argparse
+import json
+import sys
+import tracemalloc
+import eliza_logic
+
+# Strategy configurations compared by default: (label, strategy, options for the Search class)
+DEFAULT_CONFIGS = [
+	("greedy", "greedy", {}),
+	("astar w=0.5", "astar", {"weight": 0.5}),
+	("astar w=0.2", "astar", {"weight": 0.2}),
+	("beam w=100", "beam", {"beam_width": 100}),
+	("ida w=0.2", "ida", {"weight": 0.2}),
+]
+
+def median(values):
+	values = sorted(values)
+	if not values:
+		return 0
+	middle = len(values) // 2
+	return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+def percentile(values, fraction):
+	""" Nearest-rank percentile, e.g. fraction 0.95 for p95. """
+	values = sorted(values)
+	if not values:
+		return 0
+	return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def compare_strategies(seeds, configs = DEFAULT_CONFIGS, max_nodes = 100000):
+	""" Run every strategy configuration over the same seeded deals and print solve time, nodes expanded and
+	solution length for each. 'max_nodes' caps each individual solve so one bad deal can't stall the run. """
+
+	boards = [eliza_logic.seeded_game(seed).board() for seed in seeds]
+	rows = []
+	for label, strategy, options in configs:
+		times = []
+		nodes = 0
+		lengths = []
+		for board in boards:
+			searcher = eliza_logic.STRATEGIES[strategy](max_nodes = max_nodes, **options)
+			begin = timer()
+			moves = searcher.search(board)
+			times.append(timer() - begin)
+			nodes += searcher.nodes_expanded
+			if moves is not None:
+				lengths.append(len(moves))
+
+		rows.append((label, len(lengths), sum(times), median(times), max(times), nodes, sum(lengths) / float(max(len(lengths), 1))))
+		print("%-14s solved %3d/%d  total %7.2fs  median %6.3fs  max %6.2fs  nodes %9d  avg moves %5.1f" % ((rows[-1][0], rows[-1][1], len(boards)) + rows[-1][2:]))
+
+	return rows
+
+def compare_pruning(seeds, strategy = "greedy", max_nodes = 100000, **options):
+	""" Run one strategy over the seeded deals with no pruning, each pruning rule on its own, the default set, and
+	every rule, and print how much each shrank the search: nodes expanded, children generated, moves cut. """
+
+	boards = [eliza_logic.seeded_game(seed).board() for seed in seeds]
+	configs = [("none", ())] + [(rule, (rule,)) for rule in eliza_logic.PRUNING_RULES]
+	configs += [("default", eliza_logic.DEFAULT_PRUNING), ("all", eliza_logic.PRUNING_RULES)]
+
+	rows = []
+	for label, prune in configs:
+		seconds = 0.0
+		nodes = 0
+		children = 0
+		cut = 0
+		solved = 0
+		for board in boards:
+			searcher = eliza_logic.STRATEGIES[strategy](max_nodes = max_nodes, prune = prune, **options)
+			begin = timer()
+			moves = searcher.search(board)
+			seconds += timer() - begin
+			nodes += searcher.nodes_expanded
+			children += searcher.children_generated
+			cut += sum(searcher.pruned.values())
+			solved += moves is not None
+
+		rows.append((label, solved, seconds, nodes, children, cut))
+
+	# Report each configuration relative to no pruning at all
+	base_nodes = float(max(rows[0][3], 1))
+	base_children = float(max(rows[0][4], 1))
+	for label, solved, seconds, nodes, children, cut in rows:
+		print("%-14s solved %3d/%d  %7.2fs  nodes %9d (%5.1f%%)  children %9d (%5.1f%%)  moves cut %9d" % (label, solved, len(boards), seconds,
+			nodes, 100.0 * nodes / base_nodes, children, 100.0 * children / base_children, cut))
+
+	return rows
+
+def parallel_scaling(seeds, worker_counts = (1, 2, 4, 8), max_nodes = 100000):
+	""" Solve the seeded deals with serial greedy search and then the parallel strategy at each worker count, and
+	print wall time and speedup over greedy. Worth running on the hard deals, where there's enough search to
+	spread out; on a machine with fewer cores than workers the extra workers only add overhead. """
+
+	boards = [eliza_logic.seeded_game(seed).board() for seed in seeds]
+	configs = [("greedy", "greedy", {})] + [("parallel j=%d" % count, "parallel", {"workers": count}) for count in worker_counts]
+
+	rows = []
+	for label, strategy, options in configs:
+		seconds = 0.0
+		nodes = 0
+		solved = 0
+		for board in boards:
+			searcher = eliza_logic.STRATEGIES[strategy](max_nodes = max_nodes, **options)
+			begin = timer()
+			moves = searcher.search(board)
+			seconds += timer() - begin
+			nodes += searcher.nodes_expanded
+			solved += moves is not None
+
+		rows.append((label, solved, seconds, nodes))
+		print("%-14s solved %3d/%d  %7.2fs  speedup %5.2fx  nodes %9d  %8.0f nodes/sec" % (label, solved, len(boards), seconds,
+			rows[0][2] / max(seconds, 1e-9), nodes, nodes / max(seconds, 1e-9)))
+
+	return rows
+
+def make_corpus(filename, seeds, typical = 20, hard = 10, unsolvable = 10, max_nodes = 200000):
+	""" Solve the seeded deals with greedy search and write a benchmark corpus: the first 'typical' solved deals,
+	the 'hard' solved deals that took the most nodes, and the 'unsolvable' deals that took the most nodes to give
+	up on. Deals are written as exact_setup hashes under "# [category]" headers. """
+
+	solved = []
+	failed = []
+	for seed in seeds:
+		board = eliza_logic.seeded_game(seed).board()
+		searcher = eliza_logic.GreedySearch(max_nodes = max_nodes)
+		moves = searcher.search(board)
+		if searcher.budget_exceeded:
+			continue
+		(solved if moves is not None else failed).append((searcher.nodes_expanded, seed, board.hash(canonical = 0)))
+
+	hardest = sorted(solved, reverse = True)[:hard]
+	categories = [("typical", [deal for deal in solved if deal not in hardest][:typical]), ("hard", hardest),
+		("unsolvable", sorted(failed, reverse = True)[:unsolvable])]
+
+	with open(filename, "w") as corpus:
+		corpus.write("# Benchmark deals for eliza_bench.py --corpus, as exact_setup hashes. Each one is noted with the seed it\n")
+		corpus.write("# came from and how many nodes greedy search needed to solve it (or to prove it can't be solved).\n")
+		for category, deals in categories:
+			corpus.write("\n# [%s]\n" % category)
+			for nodes, seed, hash in deals:
+				corpus.write("# seed %d, %d nodes\n%s\n" % (seed, nodes, hash))
+
+	print("Wrote %s" % ", ".join(["%d %s" % (len(deals), category) for category, deals in categories]))
+
+def read_corpus(filename):
+	""" (category, hash) for every deal in a corpus file written by make_corpus. """
+	deals = []
+	category = "deals"
+	with open(filename) as corpus:
+		for line in corpus:
+			line = line.strip()
+			if line.startswith("# [") and line.endswith("]"):
+				category = line[3:-1]
+			elif line and not line.startswith("#"):
+				deals.append((category, line))
+
+	return deals
+
+def run_suite(deals, strategy = "greedy", max_nodes = 200000, repeats = 3, **options):
+	""" Solve every corpus deal and record its time, nodes expanded, peak memory and solution length. The time is
+	the best of 'repeats' passes over the whole corpus: most deals take well under a second, and the machine can
+	slow down for seconds at a time, so solving the same deal again straight away doesn't help much. Memory is
+	measured on a run of its own, because tracemalloc slows allocation down enough to spoil the timing. """
+
+	results = []
+	for category, hash in deals:
+		board = eliza_logic.Board.from_hash(hash)
+		searcher = eliza_logic.STRATEGIES[strategy](max_nodes = max_nodes, **options)
+		begin = timer()
+		moves = searcher.search(board)
+		seconds = timer() - begin
+
+		tracemalloc.start()
+		eliza_logic.STRATEGIES[strategy](max_nodes = max_nodes, **options).search(board)
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+
+		status = "solved" if moves is not None else "timeout" if searcher.budget_exceeded else "unsolvable"
+		results.append({"deal": hash, "category": category, "status": status, "seconds": seconds, "nodes": searcher.nodes_expanded,
+			"peak_kb": peak / 1024.0, "moves": len(moves) if moves is not None else None})
+
+	for _ in range(repeats - 1):
+		for result in results:
+			board = eliza_logic.Board.from_hash(result["deal"])
+			begin = timer()
+			eliza_logic.STRATEGIES[strategy](max_nodes = max_nodes, **options).search(board)
+			result["seconds"] = min(result["seconds"], timer() - begin)
+
+	return results
+
+def compare_optimizer(deals, strategy = "greedy", max_nodes = 200000, depths = (0, 3), **options):
+	""" Solve every corpus deal and shorten each solution with optimize_solution at each lookahead depth, and
+	print the share of moves removed and how long the optimizing took. """
+
+	solutions = []
+	for category, hash in deals:
+		board = eliza_logic.Board.from_hash(hash)
+		moves = eliza_logic.STRATEGIES[strategy](max_nodes = max_nodes, **options).search(board)
+		if moves is not None:
+			solutions.append((board, moves))
+
+	total = sum([len(moves) for board, moves in solutions])
+	print("%s: %d solutions, %d moves" % (strategy, len(solutions), total))
+	for depth in depths:
+		begin = timer()
+		shortened = sum([len(eliza_logic.optimize_solution(board, moves, depth)) for board, moves in solutions])
+		seconds = timer() - begin
+		print("depth %d: %d moves, %.1f%% removed, %.2fs (%.1fms per solution)" % (depth, shortened, 100.0 * (total - shortened) / max(total, 1),
+			seconds, 1000.0 * seconds / max(len(solutions), 1)))
+
+def summarise(results):
+	""" The headline numbers for a suite run: solve time and memory percentiles, nodes and solution lengths. """
+	times = [r["seconds"] for r in results]
+	memory = [r["peak_kb"] for r in results]
+	lengths = [r["moves"] for r in results if r["moves"] is not None]
+	return {"deals": len(results), "solved": len(lengths), "unsolvable": sum([1 for r in results if r["status"] == "unsolvable"]),
+		"time_p50": percentile(times, 0.5), "time_p95": percentile(times, 0.95), "time_max": max(times + [0]),
+		"nodes_total": sum([r["nodes"] for r in results]), "nodes_max": max([r["nodes"] for r in results] + [0]),
+		"peak_kb_p95": percentile(memory, 0.95), "peak_kb_max": max(memory + [0]),
+		"moves_mean": sum(lengths) / float(max(len(lengths), 1)), "moves_max": max(lengths + [0])}
+
+def print_suite(results):
+	""" One line per corpus category and one for the whole corpus. """
+	categories = []
+	for r in results:
+		if r["category"] not in categories:
+			categories.append(r["category"])
+
+	for label, rows in [(c, [r for r in results if r["category"] == c]) for c in categories] + [("all", results)]:
+		summary = summarise(rows)
+		print("%-11s solved %3d/%-3d  time p50 %6.3fs p95 %6.3fs max %6.3fs  nodes %8d  peak p95 %7.0fKB max %7.0fKB  moves mean %5.1f max %3d" % (label,
+			summary["solved"], summary["deals"], summary["time_p50"], summary["time_p95"], summary["time_max"], summary["nodes_total"],
+			summary["peak_kb_p95"], summary["peak_kb_max"], summary["moves_mean"], summary["moves_max"]))
+
+# Summary figures compare_baseline checks, and which way is worse: more is worse unless marked -1
+BASELINE_METRICS = [("solved", -1), ("time_p50", 1), ("time_p95", 1), ("time_max", 1), ("nodes_total", 1), ("nodes_max", 1),
+	("peak_kb_p95", 1), ("peak_kb_max", 1), ("moves_mean", 1), ("moves_max", 1)]
+
+def compare_baseline(baseline, summary, threshold = 0.1, time_threshold = 0.25, time_floor = 0.05):
+	""" Print each headline number next to the baseline's and return the ones that got worse by more than
+	'threshold' (a fraction, so 0.1 is 10%). Timings get 'time_threshold' instead, and have to be at least
+	'time_floor' seconds slower as well: nodes and moves come out the same on every run, but even best-of-several
+	times wander by several percent, and a lot more than that for the quick ones. A drop in deals solved is always a
+	regression. """
+
+	regressions = []
+	for metric, direction in BASELINE_METRICS:
+		old = baseline[metric]
+		new = summary[metric]
+		change = (new - old) / float(old) if old else 0.0
+		if direction < 0:
+			worse = new < old
+		elif metric.startswith("time_"):
+			worse = change > time_threshold and new - old > time_floor
+		else:
+			worse = change > threshold
+		print("%-12s %12.3f -> %12.3f  %+7.1f%%%s" % (metric, old, new, 100.0 * change, "  REGRESSION" if worse else ""))
+		if worse:
+			regressions.append(metric)
+
+	return regressions
+
+def search_options(args):
+	""" The strategy and Search options out of the solver command line options, minus the ones that only mean
+	something to global_solve. """
+	options = eliza_logic.solver_options(args)
+	strategy = options.pop("strategy")
+	for unused in ("portfolio", "cache", "max_nodes", "optimize", "optimize_depth"):
+		options.pop(unused)
+	return strategy, options
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "Compare solver strategies, or pruning rules, on a range of seeded deals, or benchmark one solver on a fixed corpus.")
+	parser.add_argument("seeds", nargs = "?", default = "0-49", help = "seed range (default: 0-49)")
+	parser.add_argument("--corpus", metavar = "FILE", help = "benchmark the solver picked by --strategy etc. on this corpus (like bench_corpus.txt)")
+	parser.add_argument("--save", metavar = "FILE", help = "with --corpus, save the results as a JSON baseline")
+	parser.add_argument("--compare", metavar = "FILE", help = "with --corpus, compare against a saved baseline and exit 1 on a regression")
+	parser.add_argument("--threshold", type = float, default = 0.1, help = "how much worse (as a fraction) counts as a regression (default: 0.1)")
+	parser.add_argument("--time-threshold", type = float, default = 0.25, help = "the same for solve times, which vary from run to run (default: 0.25)")
+	parser.add_argument("--time-floor", type = float, default = 0.05, help = "seconds a solve time has to get slower by before it counts as a regression (default: 0.05)")
+	parser.add_argument("--repeats", type = int, default = 3, help = "with --corpus, time each deal as its best over this many passes of the corpus (default: 3)")
+	parser.add_argument("--optimizer", action = "store_true", help = "with --corpus, report how much optimize_solution shortens the solutions instead")
+	parser.add_argument("--make-corpus", metavar = "FILE", help = "write a corpus of typical, hard and unsolvable deals picked from the seeds")
+	parser.add_argument("--pruning", metavar = "STRATEGY", help = "compare pruning rules for this strategy instead of comparing strategies")
+	parser.add_argument("--scaling", metavar = "COUNTS", help = "compare the parallel strategy at these worker counts (like 1,2,4,8) against greedy")
+	eliza_logic.add_solver_arguments(parser)
+	# Every solve gets a node budget here, so one bad deal can't stall the run
+	parser.set_defaults(max_nodes = 100000)
+	args = parser.parse_args()
+
+	if args.make_corpus:
+		make_corpus(args.make_corpus, eliza_logic.parse_seeds(args.seeds))
+	elif args.corpus and args.optimizer:
+		strategy, options = search_options(args)
+		compare_optimizer(read_corpus(args.corpus), strategy, args.max_nodes, sorted(set([0, args.optimize_depth or 3])), **options)
+	elif args.corpus:
+		strategy, options = search_options(args)
+		results = run_suite(read_corpus(args.corpus), strategy, args.max_nodes, args.repeats, **options)
+		print_suite(results)
+		summary = summarise(results)
+
+		if args.save:
+			with open(args.save, "w") as baseline:
+				json.dump({"corpus": args.corpus, "strategy": strategy, "options": options, "max_nodes": args.max_nodes,
+					"summary": summary, "deals": results}, baseline, indent = 1)
+			print("Saved baseline to %s" % args.save)
+
+		if args.compare:
+			with open(args.compare) as baseline:
+				regressions = compare_baseline(json.load(baseline)["summary"], summary, args.threshold, args.time_threshold, args.time_floor)
+			if regressions:
+				print("%d regression(s): %s" % (len(regressions), ", ".join(regressions)))
+				sys.exit(1)
+			print("No regressions.")
+	elif args.scaling:
+		parallel_scaling(eliza_logic.parse_seeds(args.seeds), [int(count) for count in args.scaling.split(",")], max_nodes = args.max_nodes)
+	elif args.pruning:
+		compare_pruning(eliza_logic.parse_seeds(args.seeds), args.pruning, max_nodes = args.max_nodes)
+	else:
+		compare_strategies(eliza_logic.parse_seeds(args.seeds), max_nodes = args.max_nodes)
@@ -1,15 +1,104 @@
-import glob
+from timeit import default_timer as timer
+import argparse
 import math
 import six
-import sys
+import threading
 import cv2
 import numpy as np
 import pyautogui
 import time
 import mss
-from PIL import Image
 import eliza_logic
 
+# Templates, loaded on first use and kept: the anchor, plus the two freecell looks and the ten card digits, each
+# set stacked and flattened into one array (one row per template) so a whole screen of cells can be compared
+# against all of them at once
+_templates = {}
+
+def templates():
+	""" The template images, read from card_back the first time they're needed. """
+	if not _templates:
+		_templates["anchor"] = cv2.imread("card_back/anchor/anchor.png")
+		cells = np.stack([cv2.imread("card_back/freecells/cell_unlocked.png"), cv2.imread("card_back/freecells/cell_locked.png")])
+		_templates["freecells"] = cells.reshape(2, -1).astype(np.float64)
+		digits = np.stack([cv2.imread("card_back/cards/%d.png" % i) for i in range(10)])
+		_templates["digits"] = digits.reshape(10, -1).astype(np.float64)
+
+	return _templates
+
+def crop_cells(image, corners, size):
+	""" Cut a size x size square out of 'image' at each (x, y) in 'corners', all at once, as an (N, size, size, 3) array. """
+	corners = np.asarray(corners)
+	offsets = np.arange(size)
+	rows = corners[:, 1, None] + offsets
+	columns = corners[:, 0, None] + offsets
+	return image[rows[:, :, None], columns[:, None, :]]
+
+def squared_differences(cells, patterns):
+	""" Same score as cv2.matchTemplate with TM_SQDIFF, for every cell against every pattern (one flattened template
+	per row): an (N, T) array. Worked out as |a|^2 - 2ab + |b|^2 so it's one matrix product rather than N x T
+	separate comparisons. """
+	cells = cells.reshape(len(cells), -1).astype(np.float64)
+	return (cells ** 2).sum(axis = 1)[:, None] - 2 * cells.dot(patterns.T) + (patterns ** 2).sum(axis = 1)[None, :]
+
+# How far off the anchor corner can look, as mean squared difference per pixel and channel, and still count as
+# found. Past this the game window is missing or covered, and reading cards off it would be garbage.
+ANCHOR_TOLERANCE = 100
+
+# How much smaller the first, coarse, anchor search works. The anchor is only 8 pixels square, so not much.
+ANCHOR_PYRAMID = 2
+
+# Where the anchor was last found, tried first next time
+_last_anchor = {}
+
+def anchor_score(image, x, y):
+	""" Mean squared difference per pixel and channel between the anchor template and the image at (x, y). """
+	corner = templates()["anchor"]
+	patch = image[y:y + corner.shape[0], x:x + corner.shape[1], :3]
+	if x < 0 or y < 0 or patch.shape != corner.shape:
+		return float("inf")
+	return squared_differences(patch[None], corner.reshape(1, -1).astype(np.float64))[0, 0] / corner.size
+
+def match_anchor(image):
+	""" The original search: the anchor template over every position of the image. Returns (x, y) and its score. """
+	corner = templates()["anchor"]
+	result = cv2.matchTemplate(image, corner, cv2.TM_SQDIFF)
+	score, _, location, _ = cv2.minMaxLoc(result)
+	return location, score / corner.size
+
+def find_anchor(image):
+	""" Where's the anchor's top left corner? Tries where it was last time, then a search on a scaled down copy
+	of the image refined at full size around the best spot, then the full size search over everything. Raises an
+	exception if even that doesn't find anything within ANCHOR_TOLERANCE. """
+
+	if "location" in _last_anchor and anchor_score(image, *_last_anchor["location"]) <= ANCHOR_TOLERANCE:
+		return _last_anchor["location"]
+
+	corner = templates()["anchor"]
+	if "small" not in _last_anchor:
+		_last_anchor["small"] = cv2.resize(corner, (corner.shape[1] // ANCHOR_PYRAMID, corner.shape[0] // ANCHOR_PYRAMID), interpolation = cv2.INTER_AREA)
+	small = cv2.resize(image, (image.shape[1] // ANCHOR_PYRAMID, image.shape[0] // ANCHOR_PYRAMID), interpolation = cv2.INTER_AREA)
+	result = cv2.matchTemplate(small, _last_anchor["small"], cv2.TM_SQDIFF)
+	coarse_x, coarse_y = cv2.minMaxLoc(result)[2]
+
+	# Look again at full size, a couple of coarse pixels either side
+	margin = 2 * ANCHOR_PYRAMID
+	left = max(0, coarse_x * ANCHOR_PYRAMID - margin)
+	top = max(0, coarse_y * ANCHOR_PYRAMID - margin)
+	window = image[top:top + corner.shape[0] + 2 * margin, left:left + corner.shape[1] + 2 * margin]
+	(x, y), score = match_anchor(window)
+	x += left
+	y += top
+
+	# The coarse search can be fooled by something that only looks like the anchor when blurred
+	if score > ANCHOR_TOLERANCE:
+		(x, y), score = match_anchor(image)
+		if score > ANCHOR_TOLERANCE:
+			raise Exception("Can't find the game window: the best match for the anchor is %.0f off per pixel (at most %d allowed)" % (score, ANCHOR_TOLERANCE))
+
+	_last_anchor["location"] = (x, y)
+	return x, y
+
 def anchor_and_clip(image):
 	""" Locates the Eliza game inside the full screenshot and clips it out. """
 
@@ -17,79 +106,69 @@ def anchor_and_clip(image):
 	max_x = 1074
 	max_y = 675
 
-	corner = cv2.imread("card_back/anchor/anchor.png")
-	result = cv2.matchTemplate(image, corner, cv2.TM_SQDIFF)
-	x, y = cv2.minMaxLoc(result)[2]
+	x, y = find_anchor(image)
 	x += 3
 	y += 2
 
 	crop_image = image[y:y + max_y, x:x + max_x]
 	return x, y, crop_image
 
-def read_freecells(image):
-	""" Determines how many unlocked free cells there are. """
-
-	unlocked = cv2.imread("card_back/freecells/cell_unlocked.png")
-	locked = cv2.imread("card_back/freecells/cell_locked.png")
+# Offsets for approximately where the free cells are given 1600x900 game window size
+FREECELL_CORNERS = [(314 + (128 * i), 24) for i in range(4)]
 
-	lock_results = []
-	for i in range(4):
-		# Offsets for approximately here the free cells are given 1600x900 game window size
-		x_offset = 314 + (128 * i)
-		y_offset = 24
-		
-		crop_image = image[y_offset:y_offset + 4, x_offset:x_offset + 4]
-		# cv2.rectangle(image, (x_offset, y_offset), (x_offset + 4, y_offset + 2), (255, 0, 0), 1)
-		unlocked_result = cv2.matchTemplate(crop_image, unlocked, cv2.TM_SQDIFF)
-		locked_result = cv2.matchTemplate(crop_image, locked, cv2.TM_SQDIFF)
-
-		lock_results.append(0 if unlocked_result * 10 < locked_result else 1)
+# Offsets for where the cards are given 1600x900 game window size: STACK_ROWS rows of 8 stacks, listed a stack at a
+# time. A deal is the first 5 rows, but stacks grow during the game, so there's room for as many as fit the window.
+STACK_ROWS = 14
+STACK_CORNERS = [(46 + (128 * x_stack) - int(math.floor(x_stack / 2)), 238 + (30 * y_stack)) for x_stack in range(8) for y_stack in range(STACK_ROWS)]
 
-	return lock_results
+# How far off the closest digit a card corner can look, as mean squared difference per pixel and channel, and still
+# be read as that card. The two closest digits (2 and 5) are about 2850 apart; much past this it's the table, or
+# the plain face of the card above, and there's no card in that row.
+DIGIT_TOLERANCE = 1000
 
-def read_stacks(image):
-	""" Determines which cards are in which stack """
+# The same for the freecell markings, which are about 1700 apart locked and unlocked. Past this a card is covering it.
+FREECELL_TOLERANCE = 600
 
-	# Offsets for where the stacks are given 1600x900 game window size
-	width = 128
-	height = 30
-	base_x = 46
-	base_y = 238
+def read_freecells(image):
+	""" Determines which free cells are unlocked (0), locked (1) or have a card in them (2). """
 
-	digits = {}
-	for file in glob.glob("card_back/cards/*.png"):
-		digit = file.rsplit("/", 1)[1].split(".")[0]
-		digits[str(digit)] = cv2.imread(file)
+	cells = crop_cells(image, FREECELL_CORNERS, 4)
+	scores = squared_differences(cells, templates()["freecells"])
+	covered = scores.min(axis = 1) > FREECELL_TOLERANCE * cells[0].size
 
-	stacks = []
-	for x_stack in range(8):
-		stack = []
-		for y_stack in range(5):
-			sub_amount = int(math.floor(x_stack / 2))
-			coord_x = base_x + (width * x_stack) - sub_amount
-			coord_y = base_y + (height * y_stack)
-			crop_image = image[coord_y:coord_y + 16, coord_x:coord_x + 16]
+	# Column 0 is the unlocked template, column 1 the locked one
+	return [2 if covered[i] else 0 if scores[i, 0] * 10 < scores[i, 1] else 1 for i in range(4)]
 
-			result_scores = [cv2.matchTemplate(crop_image, digits[str(i)], cv2.TM_SQDIFF) for i in range(10)]
-			card_type = result_scores.index(min(result_scores))
+def read_stacks(image, rows = 5):
+	""" Determines which cards are in which stack, down to 'rows' rows (at most STACK_ROWS). A row with no card
+	in it reads as -1. """
 
-			stack.append(card_type)
+	# Score every card against all 10 digits in one go, and take the closest digit for each
+	corners = [STACK_CORNERS[x_stack * STACK_ROWS + y_stack] for x_stack in range(8) for y_stack in range(rows)]
+	cells = crop_cells(image, corners, 16)
+	scores = squared_differences(cells, templates()["digits"])
+	card_types = scores.argmin(axis = 1)
+	empty = scores.min(axis = 1) > DIGIT_TOLERANCE * cells[0].size
 
-		stacks.append(stack)
+	return [[-1 if empty[x_stack * rows + y_stack] else int(card_types[x_stack * rows + y_stack]) for y_stack in range(rows)] for x_stack in range(8)]
 
-	return stacks
+def game_hash(game_image):
+	""" The exact_setup hash for an image already clipped to the game. """
+	freecells = read_freecells(game_image)
+	freecell_hash = "".join(["FU/" if x == 0 else "FL/" for x in freecells])
+	stacks = read_stacks(game_image)
+	stack_hash = "".join(["SU%s/" % "".join([str(s) for s in stack if s >= 0]) for stack in stacks])
+	return stack_hash + freecell_hash
 
 def computer_hash(my_image):
 	""" Uses image to build the game, returns information for solving the game """
 
 	print("Beginning screen detection")
+	begin = timer()
 	offset_screen_x, offset_screen_y, my_image = anchor_and_clip(my_image)
-	freecells = read_freecells(my_image)
-	freecell_hash = "".join(["FU/" if x == 0 else "FL/" for x in freecells])
-	stacks = read_stacks(my_image)
-	stack_hash = "".join(["SU%s/" % "".join([str(s) for s in stack]) for stack in stacks])
-	print("Done. Game detected.")
-	return [offset_screen_x, offset_screen_y, stack_hash + freecell_hash]
+	hash = game_hash(my_image)
+	print("Done. Game detected in %.1f ms." % ((timer() - begin) * 1000))
+	return [offset_screen_x, offset_screen_y, hash]
 
 def read_file(filename):
 	""" Reads a screenshot from a file and solves it. """
@@ -97,75 +176,550 @@ def read_file(filename):
 	my_image = cv2.imread(filename)
 	return computer_hash(my_image)
 
+def bench_anchor(filenames, repeats = 5):
+	""" Time the original full size anchor search against find_anchor, both from cold (coarse to fine) and with the
+	last position remembered, on saved screenshots. Best of 'repeats' runs each. """
+	for filename in filenames:
+		image = cv2.imread(filename)
+		times = {"full": [], "pyramid": [], "cached": []}
+		for _ in range(repeats):
+			begin = timer()
+			legacy = match_anchor(image)[0]
+			times["full"].append(timer() - begin)
+
+			_last_anchor.pop("location", None)
+			begin = timer()
+			found = find_anchor(image)
+			times["pyramid"].append(timer() - begin)
+
+			begin = timer()
+			find_anchor(image)
+			times["cached"].append(timer() - begin)
+
+		print("%s (%dx%d): full %.1f ms, pyramid %.1f ms, cached %.2f ms, %s" % (filename, image.shape[1], image.shape[0],
+			min(times["full"]) * 1000, min(times["pyramid"]) * 1000, min(times["cached"]) * 1000,
+			"same spot" if tuple(found) == tuple(legacy) else "DIFFERENT: %s vs %s" % (str(found), str(legacy))))
+
+class ScreenCapture:
+	""" Captures the game from the screen, keeping one mss session open. The first capture grabs the whole screen
+	and finds the anchor; after that only the game's own region is grabbed, and the anchor corner is checked to
+	make sure the window hasn't moved (if it has, we go back to a full grab). Frames are mss's BGRA buffer viewed as
+	a NumPy array without copying; dropping the alpha channel is just another view. """
+
+	# The game region past the anchor's top left corner: the anchor sits 3 right and 2 down of the game
+	width = 1074 + 3
+	height = 675 + 2
+
+	def __init__(self):
+		self.screen = mss.mss()
+		self.monitor = self.screen.monitors[0]
+		self.scale = None
+		self.anchor = None
+
+	def grab(self, region):
+		""" BGRA view of a screen region, in mss's own (logical) coordinates. """
+		shot = self.screen.grab(region)
+		return np.frombuffer(shot.raw, dtype = np.uint8).reshape(shot.height, shot.width, 4)
+
+	def full_frame(self):
+		""" The whole screen. Also tells us how many pixels the screen has per logical unit (2 on a Retina display). """
+		frame = self.grab(self.monitor)
+		self.scale = frame.shape[1] / float(self.monitor["width"])
+		return frame
+
+	def game_frame(self):
+		""" Just the game region, and where in it the anchor's top left corner should be (the region can only start
+		on a whole logical unit, which on a scaled display may be a pixel or so before the anchor). """
+		left = int(self.anchor[0] / self.scale)
+		top = int(self.anchor[1] / self.scale)
+		region = {"left": self.monitor["left"] + left, "top": self.monitor["top"] + top,
+			"width": int(math.ceil(self.width / self.scale)) + 1, "height": int(math.ceil(self.height / self.scale)) + 1}
+		return self.grab(region), self.anchor[0] - int(round(left * self.scale)), self.anchor[1] - int(round(top * self.scale))
+
+	def capture(self):
+		""" Returns the game's offset on the screen (in pixels, like anchor_and_clip) and a BGR view of the game. """
+		if self.anchor is not None:
+			frame, x, y = self.game_frame()
+			if anchor_score(frame, x, y) <= ANCHOR_TOLERANCE:
+				return self.anchor[0] + 3, self.anchor[1] + 2, frame[y + 2:y + self.height, x + 3:x + self.width, :3]
+
+		# First capture, or the window moved: find it on the whole screen. matchTemplate needs contiguous pixels.
+		x, y, game_image = anchor_and_clip(np.ascontiguousarray(self.full_frame()[:, :, :3]))
+		self.anchor = (x - 3, y - 2)
+		return x, y, game_image
+
+# One capture session for the whole run, made on first use
+_screen = {}
+
 def screenshot():
 	""" Takes a screenshot from the screen and solves it. """
 	print("Taking screenshot...")
-	with mss.mss() as screenshot:
-		monitor = screenshot.monitors[0]
-		shot = screenshot.grab(monitor)
-		frame = np.array(Image.frombytes("RGB", (shot.width, shot.height), shot.rgb))
-		frame_2 = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-	return computer_hash(frame_2)
-
-def execute_solution(offset_x, offset_y, moves):
-	""" Executes solution by moving mouse and clicking. """
-
-	# Offsets for approximately where everything is given 1600x900 game window size
-	base_x = 46
-	base_y = 238
-	freecell_x = 314
-	freecell_y = 24
-	width = 128
-	height = 30
-	modifier_x = 40
-	modifier_y = 19
-
-	# Correct for retina display (change to 1 on conventional monitor)
-	res_scale = 0.5
-
-	# First, click the window
-	pyautogui.mouseDown((offset_x + 100) * res_scale, (offset_y + 100) * res_scale, button="left")
-	time.sleep(0.5)
-	pyautogui.mouseUp()
-	time.sleep(1)
-
-	# Now, replay the moves one by one
-	for move in moves:
-		# which stack, how many cards down -> which stack, how many cards down
-		x_pre, y_pre, x_post, y_post = move
+	if "capture" not in _screen:
+		_screen["capture"] = ScreenCapture()
+
+	begin = timer()
+	offset_x, offset_y, game_image = _screen["capture"].capture()
+	captured = timer()
+	hash = game_hash(game_image)
+	print("Done. Captured in %.1f ms, game detected in %.1f ms." % ((captured - begin) * 1000, (timer() - captured) * 1000))
+	return [offset_x, offset_y, hash]
+
+# How often the game region is grabbed while waiting for it to stop moving, how many identical grabs in a row count
+# as stopped, and how long to wait at most
+SETTLE_POLL = 0.02
+SETTLE_FRAMES = 2
+SETTLE_TIMEOUT = 2.0
+
+class Mouse:
+	""" Plays moves with the mouse. Rather than sleeping a fixed while after every drag, it watches the game region
+	(through a ScreenCapture) until the cards stop moving and carries on right away. Drags take 'duration' seconds,
+	which has to be over the backend's MINIMUM_DURATION: pyautogui jumps straight to the end of anything shorter,
+	and the game misses a drag like that. Up to 'batch' moves that don't touch each other's stacks are
+	played back to back before waiting (see play_solution). 'settle' off brings back the original fixed timings,
+	0.25 second drags included, whatever 'duration' says.
+	Coordinates are scaled by the capture's pixels per logical unit, so Retina and conventional screens both work.
+	'backend' is pyautogui, or something with the same calls (see StubMouse). """
+
+	def __init__(self, capture, backend = pyautogui, duration = 0.15, batch = 4, settle = 1):
+		if duration <= backend.MINIMUM_DURATION:
+			raise Exception("Move duration %.2f s is too short: drags have to take over %.2f s or they're instant" % (duration, backend.MINIMUM_DURATION))
+
+		self.capture = capture
+		self.backend = backend
+		self.duration = duration if settle else 0.25
+		self.batch = batch
+		self.settle = settle
+
+		# pyautogui sleeps a tenth of a second after every call by default; waiting for the screen replaces that
+		if settle:
+			backend.PAUSE = 0
+
+	def point(self, offset_x, offset_y, slot, row):
+		""" Where to grab a card: 'row' cards down stack 'slot', or freecell 'slot' - 8, in mouse coordinates. """
+
+		# Offsets for approximately where everything is given 1600x900 game window size
+		base_x = 46
+		base_y = 238
+		freecell_x = 314
+		freecell_y = 24
+		width = 128
+		height = 30
+		modifier_x = 40
+		modifier_y = 19
 
 		# If it's a regular stack, move to the offset
-		if x_pre < 8:
-			x_pre_final = offset_x + base_x + (width * x_pre) + modifier_x
-			y_pre_final = offset_y + base_y + (height * y_pre) + modifier_y
+		if slot < 8:
+			x = offset_x + base_x + (width * slot) + modifier_x
+			y = offset_y + base_y + (height * row) + modifier_y
 		# Separate offsets for freecell
 		else:
-			x_pre_final = offset_x + freecell_x + (width * (x_pre - 8)) + modifier_x
-			y_pre_final = offset_y + freecell_y + modifier_y
-
-		if x_post < 8:
-			x_post_final = offset_x + base_x + (width * x_post) + modifier_x
-			y_post_final = offset_y + base_y + (height * y_post) + modifier_y
-		else:
-			x_post_final = offset_x + freecell_x + (width * (x_post - 8)) + modifier_x
-			y_post_final = offset_y + freecell_y + modifier_y
+			x = offset_x + freecell_x + (width * (slot - 8)) + modifier_x
+			y = offset_y + freecell_y + modifier_y
+
+		# The offsets are screen pixels; the mouse works in logical units (half as many on a Retina display)
+		return x / self.capture.scale, y / self.capture.scale
+
+	def click_window(self, offset_x, offset_y):
+		""" Click the game window so it has focus before we start dragging. """
+		x = (offset_x + 100) / self.capture.scale
+		y = (offset_y + 100) / self.capture.scale
+		if not self.settle:
+			self.backend.mouseDown(x, y, button = "left")
+			time.sleep(0.5)
+			self.backend.mouseUp()
+			time.sleep(1)
+			return
 
-		print("Mouse to %d, %d -> drag to %d, %d" % (x_pre_final, y_pre_final, x_post_final, y_post_final))
+		self.backend.click(x, y, button = "left")
+		self.wait()
 
-		# Move the mouse to the beginning place
-		pyautogui.moveTo(x_pre_final * res_scale, y_pre_final * res_scale, duration = 0.25)
+	def drag(self, offset_x, offset_y, move):
+		""" Plays one move, given as (stack, how many cards down) -> (stack, how many cards down) like play_game
+		hands back. Doesn't wait for the game to catch up; that's wait(). """
+		x_pre, y_pre, x_post, y_post = move
+		start = self.point(offset_x, offset_y, x_pre, y_pre)
+		end = self.point(offset_x, offset_y, x_post, y_post)
+		print("Mouse to %d, %d -> drag to %d, %d" % (start + end))
+
+		self.backend.moveTo(start[0], start[1], duration = self.duration)
+		self.backend.dragTo(end[0], end[1], duration = self.duration, button = "left")
+
+	def wait(self):
+		""" Wait for the game to stop moving: grab the game region until SETTLE_FRAMES grabs in a row look the same,
+		or SETTLE_TIMEOUT runs out. Every fourth pixel each way is plenty to see a card move. """
+		if not self.settle:
+			time.sleep(0.25)
+			return
 
-		# Click and drag to the end
-		pyautogui.dragTo(x_post_final * res_scale, y_post_final * res_scale, duration = 0.25, button = "left")
+		deadline = timer() + SETTLE_TIMEOUT
+		previous = None
+		same = 0
+		while timer() < deadline:
+			_, _, game_image = self.capture.capture()
+			frame = game_image[::4, ::4]
+			same = same + 1 if previous is not None and np.array_equal(frame, previous) else 0
+			if same >= SETTLE_FRAMES:
+				return
+			previous = frame
+			time.sleep(SETTLE_POLL)
+
+def drag_for(board, move):
+	""" The drag that plays solver move 'move' on 'board', worked out the same way as in play_game. """
+	i, j = move
+	return (i, len(board.cards[i]) - board.moving_amount(move), j, max(0, len(board.cards[j]) - 1))
+
+# Moves handed to the mouse straight from the search, while the optimizer works on the rest of the solution in the
+# background. The optimizer can't touch these, so only a few; dragging them takes longer than most optimizing does.
+PIPELINE_HEAD = 4
+
+# After a move, how long the screen gets to show the board we expect before we decide something went wrong (a
+# collapse animates for a while)
+VERIFY_WAIT = 1.5
+
+# How many times a deal is solved again after the board on screen went off script, before giving up on it
+MAX_RESOLVES = 3
+
+def stream_moves(board, moves, optimize = 1, depth = 0):
+	""" A queue the moves come out of one at a time, then None. The first PIPELINE_HEAD go in right away; the rest
+	go through optimize_solution on a background thread first, so the mouse can get going meanwhile. """
+	pending = six.moves.queue.Queue()
+
+	def produce():
+		head = moves[:PIPELINE_HEAD]
+		for move in head:
+			pending.put(move)
+
+		rest = moves[len(head):]
+		try:
+			if optimize and rest:
+				shorter = eliza_logic.optimize_solution(eliza_logic.play_moves(board, head), rest, depth)
+				if len(shorter) < len(rest):
+					print("Optimized the rest of the solution from %d to %d moves" % (len(rest), len(shorter)))
+				rest = shorter
+		finally:
+			# If the optimizer falls over, the solution still gets played as it was
+			for move in rest:
+				pending.put(move)
+			pending.put(None)
+
+	producer = threading.Thread(target = produce)
+	producer.daemon = True
+	producer.start()
+	return pending
+
+def board_matches(board, stacks, freecells):
+	""" Could the screen, as read by read_stacks and read_freecells, be showing 'board'? Only what the reader sees
+	is compared: each stack's cards, and nothing below them, as far down as it was read, and whether each freecell
+	has a card in it or, if not, is locked. """
+	for i in range(8):
+		cards = board.cards[i][:len(stacks[i])]
+		if board.collapsed[i] < 0 and stacks[i] != cards + [-1] * (len(stacks[i]) - len(cards)):
+			return False
 
-		# Wait for a while
-		time.sleep(0.25)
+	for i in range(4):
+		slot = 8 + i
+		if board.collapsed[slot] < 0 and freecells[i] != (2 if board.cards[slot] else board.locked[slot]):
+			return False
+
+	return True
+
+def observed_board(states, stacks, freecells):
+	""" The screen isn't showing what the last moves should have left. 'states' are the boards before each of
+	those moves: either we only got part way through them (a drag missed) or a different move happened somewhere
+	(it let go over the wrong stack). Returns whichever board, one of 'states' or one move on from one of them,
+	matches the screen, or None if none does. """
+	for previous in reversed(states):
+		if board_matches(previous, stacks, freecells):
+			return previous.copy()
+
+	for previous in reversed(states):
+		for i in range(len(previous.cards)):
+			for j in range(len(previous.cards)):
+				if previous.is_legal((i, j)):
+					board = eliza_logic.play_moves(previous, [(i, j)])
+					if board_matches(board, stacks, freecells):
+						return board
+
+def read_board(mouse, expected):
+	""" Wait for the game to settle and read it, until it shows 'expected' or VERIFY_WAIT runs out. Returns the
+	game's offset and what was read last, as (offset_x, offset_y, stacks, freecells, matched). """
+	deadline = timer() + VERIFY_WAIT
+	while True:
+		mouse.wait()
+		offset_x, offset_y, game_image = mouse.capture.capture()
+		stacks = read_stacks(game_image, STACK_ROWS)
+		freecells = read_freecells(game_image)
+		matched = board_matches(expected, stacks, freecells)
+		if matched or timer() > deadline:
+			return offset_x, offset_y, stacks, freecells, matched
+
+def play_solution(mouse, board, moves, options, verify = 1):
+	""" Play solver moves for 'board' on screen with a Mouse. The mouse starts on the first moves while the rest
+	are still being optimized (see stream_moves). Moves that keep off each other's stacks, and don't collapse
+	anything, go one after another without waiting for the screen, up to mouse.batch at a time. With 'verify' on,
+	after every batch the game is read back and compared with the board it should have left; if it's different, we
+	work out what's really there (see observed_board) and solve again from that, using the global_solve 'options'.
+	Returns 1 if the game was played out, 0 if we gave up. """
+
+	options = dict(options)
+	optimize = options.pop("optimize", 1)
+	depth = options.pop("optimize_depth", 0)
+
+	# Every wait on the screen can find the window covered or gone, and then there's nothing to do but stop
+	try:
+		offset_x, offset_y, _ = mouse.capture.capture()
+		mouse.click_window(offset_x, offset_y)
+	except Exception as error:
+		print("Lost the game window (%s), stopping." % error)
+		return 0
+
+	for attempt in range(MAX_RESOLVES + 1):
+		pending = stream_moves(board, moves, optimize, depth)
+		expected = board.copy()
+		observed = None
+		held = []
+		while True:
+			move = held.pop() if held else pending.get()
+			if move is None:
+				return 1
+
+			states = []
+			touched = set()
+			while True:
+				states.append(expected.copy())
+				mouse.drag(offset_x, offset_y, drag_for(expected, move))
+				touched.update(move)
+				collapses = expected.move_collapses(move)
+				expected.make_move(move)
+
+				# A collapse animates and can unlock a freecell, so whatever comes next waits for it
+				if collapses or len(states) >= mouse.batch:
+					break
+				try:
+					move = pending.get_nowait()
+				except six.moves.queue.Empty:
+					break
+				if move is None or touched.intersection(move):
+					held.append(move)
+					break
+
+			# Once the game's won the screen moves on to the win animation, so there's nothing left to check
+			if expected.is_complete():
+				continue
+			try:
+				if not verify:
+					mouse.wait()
+					continue
+				offset_x, offset_y, stacks, freecells, matched = read_board(mouse, expected)
+			except Exception as error:
+				print("Lost the game window (%s), stopping." % error)
+				return 0
+			if not matched:
+				observed = observed_board(states, stacks, freecells)
+				break
+
+		if observed is None:
+			print("The board on screen isn't one we expected after move %s. Stopping." % (move,))
+			return 0
+		if attempt == MAX_RESOLVES:
+			print("The board on screen went off script after move %s. Gave up after solving again %d times." % (move, MAX_RESOLVES))
+			return 0
+
+		print("The board on screen went off script after move %s, solving again from there." % (move,))
+		board = observed
+		game = eliza_logic.Game(0)
+		game.load_board(board)
+		if game.global_solve(-1, optimize = 0, **options) is None:
+			print("No solution from here (%s)." % game.result)
+			return 0
+		moves = game.result.moves
+
+# How long the stub screen keeps changing after each drag or click in bench_mouse
+STUB_ANIMATION = 0.15
+
+class StubScreen:
+	""" Stands in for ScreenCapture in bench_mouse: a Retina sized game whose pixels keep changing for STUB_ANIMATION
+	seconds after the mouse lets go, then hold still. """
+
+	scale = 2.0
+
+	def __init__(self):
+		self.busy_until = 0
+		self.frame = np.zeros((ScreenCapture.height, ScreenCapture.width, 3), dtype = np.uint8)
+
+	def animate(self):
+		self.busy_until = timer() + STUB_ANIMATION
+
+	def capture(self):
+		if timer() < self.busy_until:
+			self.frame = self.frame + 1
+		return 100, 100, self.frame
+
+class StubMouse:
+	""" Stands in for pyautogui in bench_mouse. Each call takes as long as pyautogui's would (a drag that isn't
+	over pyautogui's MINIMUM_DURATION is instant, and PAUSE is slept after every call) but nothing moves. """
+
+	PAUSE = 0.1
+	MINIMUM_DURATION = 0.1
+
+	def __init__(self, screen):
+		self.screen = screen
+
+	def call(self, duration = 0):
+		time.sleep((duration if duration > self.MINIMUM_DURATION else 0) + self.PAUSE)
+
+	def moveTo(self, x, y, duration = 0):
+		self.call(duration)
+
+	def dragTo(self, x, y, duration = 0, button = "left"):
+		self.call(duration)
+		self.screen.animate()
+
+	def click(self, x, y, button = "left"):
+		self.call()
+		self.screen.animate()
+
+	def mouseDown(self, x, y, button = "left"):
+		self.call()
+
+	def mouseUp(self):
+		self.call()
+		self.screen.animate()
+
+def bench_mouse(seeds, duration = 0.15, batch = 4, options = {}):
+	""" Time playing the solutions for seeded deals through StubMouse and StubScreen: the original fixed sleeps
+	against waiting for the screen to settle, with 'duration' drags and batches of up to 'batch' moves. """
+
+	solutions = []
+	for seed in seeds:
+		game = eliza_logic.seeded_game(seed)
+		board = game.board()
+		if game.global_solve(-1, **options) is not None:
+			solutions.append((board, game.result.moves))
+
+	moves = sum([len(m) for _, m in solutions])
+	print("%d of %d deals solved, %d moves to play" % (len(solutions), len(seeds), moves))
+	if not moves:
+		return
+
+	runs = [("fixed sleeps", dict(batch = 1, settle = 0)), ("settle", dict(duration = duration, batch = 1, settle = 1)),
+		("settle, batched", dict(duration = duration, batch = batch, settle = 1))]
+	fixed = None
+	for name, mouse_options in runs:
+		screen = StubScreen()
+		mouse = Mouse(screen, StubMouse(screen), **mouse_options)
+		begin = timer()
+		for board, solution in solutions:
+			play_solution(mouse, board, solution, {"optimize": 0}, verify = 0)
+		seconds = timer() - begin
+		fixed = fixed or seconds
+		print("%-16s %7.1f s, %.3f s/move, %.1fx" % (name, seconds, seconds / moves, fixed / seconds))
+
+def full_deal(hash):
+	""" Does a hash read off the screen look like a whole new deal: four of every card and nothing collapsed? Mid
+	game, mid animation, or with something covering the cards, it won't. """
+	cards = "".join([chunk[2:] for chunk in hash.split("/") if chunk.startswith("S")])
+	return all([cards.count(str(card)) == 4 for card in range(10)])
+
+def watch(mouse, options, interval = 0.5, verify = 1):
+	""" Keep watching the screen: whenever a new deal shows up, solve it and play it, then wait for the next one.
+	A deal has to read the same on two polls in a row, so we don't act on a half drawn board. Prints the time
+	spent capturing, reading, solving and playing each game, and games per hour so far. Ctrl-C to stop. """
+
+	capture = mouse.capture
+	totals = dict([(step, 0.0) for step in ("capture", "detect", "solve", "execute")])
+	games = 0
+	begin = timer()
+	handled = None
+	previous = None
+	missing = 0
+	print("Watching for new deals. Ctrl-C to stop.")
+	try:
+		while True:
+			time.sleep(interval)
+			start = timer()
+			try:
+				offset_x, offset_y, game_image = capture.capture()
+			except Exception as error:
+				# Window covered or gone; say so once and keep looking
+				if not missing:
+					print(error)
+				missing = 1
+				continue
+			missing = 0
+			captured = timer()
+			hash = game_hash(game_image)
+			detected = timer()
+
+			if hash == handled or hash != previous or not full_deal(hash):
+				previous = hash
+				continue
+
+			print("New deal: %s" % hash)
+			handled = hash
+			game = eliza_logic.Game(0)
+			game.exact_setup(hash)
+			board = game.board()
+			# Optimizing happens while the first moves are played
+			result = game.global_solve(-1, **dict(options, optimize = 0))
+			solved = timer()
+			if result is None:
+				print("Not playing this one (%s). Deal a new game." % game.result)
+				continue
+
+			if not play_solution(mouse, board, game.result.moves, options, verify):
+				print("Deal a new game.")
+				continue
+			executed = timer()
+
+			games += 1
+			steps = {"capture": captured - start, "detect": detected - captured, "solve": solved - detected, "execute": executed - solved}
+			for step in steps:
+				totals[step] += steps[step]
+			print("Game %d: capture %.1f ms, detect %.1f ms, solve %.2f s, execute %.1f s. %.1f games/hour" % (games, steps["capture"] * 1000,
+				steps["detect"] * 1000, steps["solve"], steps["execute"], games * 3600 / (timer() - begin)))
+	except KeyboardInterrupt:
+		pass
+
+	if games:
+		print("%d games in %.0f seconds (%.1f games/hour). Average capture %.1f ms, detect %.1f ms, solve %.2f s, execute %.1f s" % (games,
+			timer() - begin, games * 3600 / (timer() - begin), totals["capture"] * 1000 / games, totals["detect"] * 1000 / games,
+			totals["solve"] / games, totals["execute"] / games))
 
 def main():
 	""" Dispatches by reading file argument on command line or taking snapshot of screen. """
 
-	if len(sys.argv) > 1 and sys.argv[1]:
-		_, _, hash = read_file(sys.argv[1])
+	parser = argparse.ArgumentParser(description = "Read an Eliza solitaire game from the screen (or a saved screenshot) and solve it.")
+	parser.add_argument("filename", nargs = "?", help = "saved screenshot to read instead of the screen")
+	parser.add_argument("--watch", action = "store_true", help = "keep watching the screen, solving and playing every new deal that shows up")
+	parser.add_argument("--interval", type = float, default = 0.5, help = "seconds between screen polls in watch mode (default: 0.5)")
+	parser.add_argument("--no-verify", action = "store_true", help = "don't read the board back after each move to check it went as planned")
+	parser.add_argument("--move-duration", type = float, default = 0.15, help = "seconds each mouse move and drag takes, over pyautogui's minimum of 0.1 (default: 0.15)")
+	parser.add_argument("--batch", type = int, default = 4, help = "most moves played back to back before waiting for the screen (default: 4)")
+	parser.add_argument("--no-settle", action = "store_true", help = "play with the original fixed timings (0.25 s drags and sleeps) instead of waiting for the cards to stop")
+	parser.add_argument("--bench-mouse", metavar = "SEEDS", help = "time playing the solutions for a seed range like 0-4 against a stub mouse and exit")
+	parser.add_argument("--bench-anchor", nargs = "+", metavar = "SCREENSHOT", help = "time the anchor search on saved screenshots and exit")
+	eliza_logic.add_solver_arguments(parser)
+	# Restarts and re-captures of the same deal come up a lot here, so keep solutions around by default. A deal
+	# that takes longer than this to solve is quicker to restart than to wait out.
+	parser.set_defaults(cache = "solutions.db", time_limit = 20, max_memory = 1024)
+	args = parser.parse_args()
+
+	if args.bench_anchor:
+		bench_anchor(args.bench_anchor)
+		return
+
+	if args.bench_mouse:
+		bench_mouse(list(eliza_logic.parse_seeds(args.bench_mouse)), args.move_duration, args.batch, eliza_logic.solver_options(args))
+		return
+
+	mouse_options = {"duration": args.move_duration, "batch": args.batch, "settle": not args.no_settle}
+	if args.watch:
+		watch(Mouse(ScreenCapture(), **mouse_options), eliza_logic.solver_options(args), args.interval, not args.no_verify)
+		return
+
+	if args.filename:
+		_, _, hash = read_file(args.filename)
 		offset_x = 0
 		offset_y = 0
 	else:
@@ -175,16 +729,24 @@ def main():
 	game = eliza_logic.Game(0)
 	game.exact_setup(hash)
 	print(game)
-	result = game.global_solve(-1)
+	board = game.board()
+	options = eliza_logic.solver_options(args)
+	# Played from the screen, the solution is optimized while its first moves are played (see play_solution)
+	result = game.global_solve(-1, **dict(options, optimize = 0 if not args.filename else options["optimize"]))
 	print(result)
 
+	# No solution: whether it's proven unsolvable or just too slow, the thing to do is deal a new game
+	if result is None:
+		print("Restart the deal (%s)." % game.result)
+		return
+
 	# If it was a screen grab, we can actually do this -- just type n/q/c to quit or anything else to continue
 	if result is not None and offset_x and offset_y:
 		x = six.moves.input("Ready for automated solution? ")
 		if x.lower() in ["n", "q", "c"]:
 			return
 
-		execute_solution(offset_x, offset_y, result)
+		play_solution(Mouse(_screen["capture"], **mouse_options), board, game.result.moves, options, not args.no_verify)
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
@@ -1,7 +1,46 @@
-from collections import deque
 from timeit import default_timer as timer
+from array import array
+import argparse
+import heapq
+import itertools
 import random
 import copy
+import multiprocessing
+import queue
+import sqlite3
+from multiprocessing import shared_memory
+
+# Random 64-bit keys for Zobrist hashing the Board: one per (position in a slot, card), one per collapsed card,
+# and one per slot kind (freecell bit + lock bit). Seeded so every process agrees on the same keys.
+ZOBRIST_MASK = (1 << 64) - 1
+_zobrist_random = random.Random(0x2B1A)
+ZOBRIST_CARDS = [[_zobrist_random.getrandbits(64) for card in range(256)] for position in range(64)]
+ZOBRIST_COLLAPSED = [_zobrist_random.getrandbits(64) for card in range(256)]
+ZOBRIST_SLOT = [_zobrist_random.getrandbits(64) for kind in range(4)]
+
+# What Search.stats() breaks the time down into when timing is on. The board's Zobrist hash and score are kept
+# up to date inside make_move and unmake_move, so hashing and scoring the board land under "move"; "heuristic" is
+# ranking the children, and "copy" is packing boards onto the frontier and unpacking them again.
+PHASES = ("movegen", "move", "heuristic", "copy")
+
+# Rough bytes of memory per board a search holds: one waiting on a frontier (entry tuple, priority, packed board)
+# and one already visited (its hash in the visited set, plus its parent table row). Measured with tracemalloc on
+# greedy and A* runs; the memory budget goes by these rather than asking the OS, which is slow and not portable.
+FRONTIER_BYTES = 320
+VISITED_BYTES = 100
+
+# Move pruning rules the search strategies can switch on and off:
+#   empty          -- all empty stacks are the same, so only move to the first one
+#   pointless      -- moving a whole stack to another empty stack, or a freecell card to another freecell, just
+#                     swaps two slots, and the board hash doesn't care about slot order
+#   transposition  -- don't queue a board the search has already visited (it would be thrown away later anyway)
+#   collapse       -- whenever a move collapses a card type, only consider collapsing moves
+# The first three only ever drop moves to boards the search would throw away as duplicates, so they never change
+# what gets solved. "collapse" is different: it is usually right, but not provably safe -- a collapse uses up the
+# stack it happens on, and occasionally keeping that stack free is worth more than the freecell it unlocks -- so
+# it is off by default.
+PRUNING_RULES = ("empty", "pointless", "transposition", "collapse")
+DEFAULT_PRUNING = ("empty", "pointless", "transposition")
 
 class Stack:
 	""" A stack is a place where cards can go; types are 'stack' and 'freecell'. """
@@ -136,6 +175,322 @@ class Stack:
 		""" Quick check: Is this stack collapsed and done? Used for detecting game end. """
 		return self.stack == "X"
 
+class Board:
+	""" Compact version of the game for the solver. Rather than a list of Stack objects, each slot (stack or freecell) is
+	an index into a few flat arrays: whether it's a freecell, whether it's locked, which card collapsed there (-1 if
+	none), and its cards as a plain list of ints.
+
+	The board also keeps a Zobrist hash of itself up to date as moves are made. Each slot hashes to the XOR of its
+	kind key and a key per (position, card), so pushing or popping cards only touches those cards. The slot hashes
+	are then added together rather than XORed: addition doesn't care about slot order, which keeps the "stacks are
+	interchangeable" idea from Game.hash(), but unlike XOR two identical slots don't cancel each other out.
+
+	The score works the same way: each slot's share of Game.get_score is cached, and a move only re-scores the slots
+	it touched. So is the length of the run of matching cards on top of each slot, which both the score and the
+	move rules need. """
+
+	__slots__ = ("freecell", "locked", "collapsed", "cards", "card_types", "slot_zobrist", "zobrist", "slot_score", "score", "runs")
+
+	def __init__(self, freecell, locked, collapsed, cards, card_types = 10):
+		self.freecell = bytearray(freecell)
+		self.locked = bytearray(locked)
+		self.collapsed = array("b", collapsed)
+		self.cards = [list(c) for c in cards]
+		self.card_types = card_types
+		self.rehash()
+
+	@classmethod
+	def from_stacks(cls, stacks, card_types = 10):
+		""" Build a board from a list of Stack objects. """
+		return cls([s.type == "freecell" for s in stacks], [1 if s.locked else 0 for s in stacks],
+			[s.past_cards if s.stack == "X" else -1 for s in stacks], [[] if s.stack == "X" else s.stack for s in stacks], card_types)
+
+	@classmethod
+	def from_hash(cls, hash, card_types = 10):
+		""" Build a board from the same hash format exact_setup reads. """
+		game = Game(0, card_types)
+		game.exact_setup(hash)
+		return cls.from_stacks(game.stacks, card_types)
+
+	def to_stacks(self):
+		""" Convert back into Stack objects, e.g. to hand back to a Game. """
+		stacks = []
+		for i in range(len(self.cards)):
+			stack = Stack("freecell" if self.freecell[i] else "stack", self.locked[i])
+			if self.collapsed[i] > -1:
+				stack.stack = "X"
+				stack.past_cards = self.collapsed[i]
+			else:
+				stack.stack = list(self.cards[i])
+			stacks.append(stack)
+
+		return stacks
+
+	def copy(self):
+		return Board(self.freecell, self.locked, self.collapsed, self.cards, self.card_types)
+
+	def slot_hash(self, i):
+		""" Same text as Stack.hash() for slot 'i'. """
+		if self.collapsed[i] > -1:
+			card_str = "X[%d]" % self.collapsed[i]
+		else:
+			card_str = "".join([str(x) for x in self.cards[i]])
+		return ("F" if self.freecell[i] else "S") + ("L" if self.locked[i] else "U") + card_str
+
+	def hash(self, canonical = 1):
+		""" Same text as Game.hash(). With 'canonical' off the slots stay in order, which exact_setup can read back as the same game. """
+		stack_chunks = ["%s/" % self.slot_hash(i) for i in range(len(self.cards))]
+		if canonical:
+			stack_chunks.sort()
+
+		return "".join(stack_chunks)
+
+	def canonical_order(self):
+		""" Slot indices in the order hash() lists them. Slots with the same text keep their index order. """
+		return sorted(range(len(self.cards)), key = lambda i: "%s/" % self.slot_hash(i))
+
+	def slot_key(self, i):
+		""" Compact byte version of slot_hash(i): one flag byte (freecell / locked / collapsed), a length byte, then the cards. """
+		flags = self.freecell[i] | (self.locked[i] << 1)
+		if self.collapsed[i] > -1:
+			return bytes(bytearray([flags | 4, 1, self.collapsed[i]]))
+
+		return bytes(bytearray([flags, len(self.cards[i])] + self.cards[i]))
+
+	def compute_slot_zobrist(self, i):
+		""" Zobrist hash of slot 'i', from scratch. """
+		value = ZOBRIST_SLOT[self.freecell[i] | (self.locked[i] << 1)]
+		if self.collapsed[i] > -1:
+			return value ^ ZOBRIST_COLLAPSED[self.collapsed[i]]
+
+		for position, card in enumerate(self.cards[i]):
+			value ^= ZOBRIST_CARDS[position][card]
+		return value
+
+	def compute_zobrist(self):
+		""" Zobrist hash of the whole board, from scratch. Kept as a cross-check of the incremental one. """
+		return sum([self.compute_slot_zobrist(i) for i in range(len(self.cards))]) & ZOBRIST_MASK
+
+	def rehash(self):
+		""" Recompute every slot's Zobrist hash, run length and score, and the totals. """
+		self.runs = [self.run_length(i) if self.cards[i] else 0 for i in range(len(self.cards))]
+		self.slot_zobrist = [self.compute_slot_zobrist(i) for i in range(len(self.cards))]
+		self.zobrist = sum(self.slot_zobrist) & ZOBRIST_MASK
+		self.slot_score = [self.compute_slot_score(i) for i in range(len(self.cards))]
+		self.score = sum(self.slot_score)
+
+	def state_key(self):
+		""" Same idea as hash(), but packed into bytes instead of text. Each slot key carries its own length, so sorting
+		and concatenating them is still unambiguous and still doesn't care about slot order. Unlike the Zobrist hash it
+		can't collide, so it's what debug mode checks the hash against. """
+		return b"".join(sorted([self.slot_key(i) for i in range(len(self.cards))]))
+
+	def pack(self):
+		""" Slot keys in slot order, so unpack() can restore exactly this board. """
+		return b"".join([self.slot_key(i) for i in range(len(self.cards))])
+
+	def unpack(self, packed):
+		""" Reset the board to a state produced by pack(). The number of slots has to match. """
+		for i, chunk in enumerate(split_packed(packed)):
+			data = bytearray(chunk)
+			self.freecell[i] = data[0] & 1
+			self.locked[i] = (data[0] >> 1) & 1
+			if data[0] & 4:
+				self.collapsed[i] = data[2]
+				self.cards[i] = []
+			else:
+				self.collapsed[i] = -1
+				self.cards[i] = list(data[2:])
+
+		self.rehash()
+
+	def first_locked_empty(self):
+		""" Which is the first locked freecell that could be unlocked by a collapse? """
+		for i in range(len(self.cards)):
+			if self.freecell[i] and self.locked[i] and self.collapsed[i] < 0:
+				return i
+
+		return -1
+
+	def run_length(self, i):
+		""" How many matching cards sit on top of slot 'i' -- the ones that would move together. """
+		cards = self.cards[i]
+		top = cards[-1]
+		run = 1
+		while run < len(cards) and cards[-run - 1] == top:
+			run += 1
+
+		return run
+
+	def is_complete(self):
+		""" Have all the card types collapsed? """
+		return sum([1 for c in self.collapsed if c > -1]) == self.card_types
+
+	def enumerate_moves(self, last_move = None):
+		""" Same moves, in the same order, as Game.enumerate_moves. One pass over the slots finds the first free cell
+		and files every slot we could move from under its top card; each destination then only looks at the
+		sources that can actually go there. """
+		cards = self.cards
+		locked = self.locked
+		freecell = self.freecell
+
+		sources = []
+		sources_by_top = {}
+		free_cell = -1
+		for i in range(len(cards)):
+			if locked[i]:
+				continue
+			if cards[i]:
+				sources.append(i)
+				sources_by_top.setdefault(cards[i][-1], []).append(i)
+			elif free_cell < 0 and freecell[i]:
+				free_cell = i
+
+		valid_moves = []
+		for i in range(len(cards)):
+			# Locked slots and freecells other than the first free one can't be destinations
+			if locked[i] or (freecell[i] and i != free_cell):
+				continue
+
+			# Anything can go somewhere empty; a stack with cards needs a matching top card
+			dest = cards[i]
+			for j in (sources_by_top.get(dest[-1], ()) if dest else sources):
+				if j != i and last_move != (i, j):
+					valid_moves.append((j, i))
+
+		return valid_moves
+
+	def is_legal(self, move):
+		""" Could this move be played? Unlike enumerate_moves, any empty unlocked freecell counts, not just the first. """
+		i, j = move
+		cards = self.cards
+		if i == j or self.locked[i] or self.locked[j] or not cards[i]:
+			return False
+		if self.freecell[j]:
+			return not cards[j]
+		return not cards[j] or cards[j][-1] == cards[i][-1]
+
+	def moving_amount(self, move):
+		""" How many cards a legal move carries: the whole top run, except 2 or 3 cards going to a freecell move one at a time. """
+		amount = self.runs[move[0]]
+		return 1 if self.freecell[move[1]] and 1 < amount < 4 else amount
+
+	def move_collapses(self, move):
+		""" Would this legal move make four of a kind at the destination? """
+		dest = move[1]
+		return len(self.cards[dest]) + self.moving_amount(move) == 4 and self.runs[dest] == len(self.cards[dest])
+
+	def make_move(self, move):
+		""" Apply a move in place and return an undo record for unmake_move. Moves are assumed legal. """
+		i, j = move
+		source = self.cards[i]
+		dest = self.cards[j]
+		slot_zobrist = self.slot_zobrist
+		undo_zobrist = (self.zobrist, slot_zobrist[i], slot_zobrist[j])
+		undo_score = (self.score, self.slot_score[i], self.slot_score[j])
+		runs = self.runs
+		undo_runs = (runs[i], runs[j])
+
+		amount = self.moving_amount(move)
+
+		# Every moving card is the same type, so the hash update is one XOR per card on each side
+		card = source[-1]
+		source_zobrist = slot_zobrist[i]
+		dest_zobrist = slot_zobrist[j]
+		for position in range(len(source) - amount, len(source)):
+			source_zobrist ^= ZOBRIST_CARDS[position][card]
+		for position in range(len(dest), len(dest) + amount):
+			dest_zobrist ^= ZOBRIST_CARDS[position][card]
+
+		dest.extend(source[-amount:])
+		del source[-amount:]
+		total = self.zobrist - slot_zobrist[i] - slot_zobrist[j] + source_zobrist
+
+		# The destination's run grows by what arrived. The source's shrinks, unless the whole run left and we have to
+		# look at what's underneath.
+		runs[j] += amount
+		if amount < runs[i]:
+			runs[i] -= amount
+		else:
+			runs[i] = self.run_length(i) if source else 0
+
+		# Did that collapse the destination? If so lock it, and a stack collapse unlocks a freecell
+		collapsed = None
+		unlocked = -1
+		if len(dest) == 4 and dest[0] == dest[1] == dest[2] == dest[3]:
+			collapsed = dest
+			self.collapsed[j] = card
+			self.locked[j] = 1
+			self.cards[j] = []
+			runs[j] = 0
+			dest_zobrist = ZOBRIST_SLOT[self.freecell[j] | 2] ^ ZOBRIST_COLLAPSED[card]
+			if not self.freecell[j]:
+				unlocked = self.first_locked_empty()
+				if unlocked > -1:
+					# An empty locked freecell becoming an empty unlocked one
+					self.locked[unlocked] = 0
+					slot_zobrist[unlocked] = ZOBRIST_SLOT[1]
+					total += ZOBRIST_SLOT[1] - ZOBRIST_SLOT[3]
+
+		slot_zobrist[i] = source_zobrist
+		slot_zobrist[j] = dest_zobrist
+		self.zobrist = (total + dest_zobrist) & ZOBRIST_MASK
+
+		# Only the two slots we touched change score, plus 10 points for an unlocked freecell
+		slot_score = self.slot_score
+		source_score = self.compute_slot_score(i, runs[i])
+		dest_score = self.compute_slot_score(j, runs[j])
+		self.score += source_score - slot_score[i] + dest_score - slot_score[j]
+		slot_score[i] = source_score
+		slot_score[j] = dest_score
+		if unlocked > -1:
+			slot_score[unlocked] = 10
+			self.score += 10
+
+		return (i, j, amount, collapsed, unlocked, undo_zobrist, undo_score, undo_runs)
+
+	def unmake_move(self, undo):
+		""" Revert a move applied by make_move. """
+		i, j, amount, collapsed, unlocked, undo_zobrist, undo_score, undo_runs = undo
+		self.zobrist, self.slot_zobrist[i], self.slot_zobrist[j] = undo_zobrist
+		self.score, self.slot_score[i], self.slot_score[j] = undo_score
+		self.runs[i], self.runs[j] = undo_runs
+		if unlocked > -1:
+			self.locked[unlocked] = 1
+			self.slot_zobrist[unlocked] = ZOBRIST_SLOT[3]
+			self.slot_score[unlocked] = 0
+
+		if collapsed is not None:
+			self.cards[j] = collapsed
+			self.collapsed[j] = -1
+			self.locked[j] = 0
+
+		dest = self.cards[j]
+		self.cards[i].extend(dest[-amount:])
+		del dest[-amount:]
+
+	def compute_slot_score(self, i, run = 0):
+		""" Slot 'i's share of Game.get_score. 'run' is the slot's top run length if we already know it. """
+		cards = self.cards[i]
+		if self.collapsed[i] > -1:
+			return 20
+		elif self.freecell[i]:
+			return 0 if self.locked[i] else 10
+		elif not cards:
+			return 10
+
+		# 5 minus the cards trapped below the top run (the index of the first card that isn't part of it)
+		run = run or self.run_length(i)
+		return 5 - (len(cards) - run - 1 if run < len(cards) else 0)
+
+	def compute_score(self):
+		""" Score of the whole board, from scratch. Kept as a cross-check of the incremental one. """
+		return sum([self.compute_slot_score(i) for i in range(len(self.cards))])
+
+	def get_score(self):
+		""" Same points as Game.get_score, kept up to date by make_move. """
+		return self.score
+
 class Game:
 	def __init__(self, how_many_free, card_types = 10, card_stacks = 8, freecells = 4, max_depth = 75):
 		""" Initial setup of the stacks and free cells; 'how_many_free' is the number of unlocked freecells. """
@@ -176,6 +531,15 @@ class Game:
 
 		return stack_text
 
+	def board(self):
+		""" Compact copy of the current game for the solver to work on. """
+		return Board.from_stacks(self.stacks, self.card_types)
+
+	def load_board(self, board):
+		""" Replace the game's stacks with the contents of a Board. """
+		self.stacks = board.to_stacks()
+		self.score = 0
+
 	def seed(self, seed):
 		random.seed(seed)
 
@@ -281,14 +645,15 @@ class Game:
 
 		return -1
 
-	def is_dead(self):
-		""" If there are no valid moves, this method of proceeding is dead. """
-		return len(self.enumerate_moves()) == 0
-
-	def enumerate_moves(self, allow_freecell = 1):
-		""" List all valid moves but don't execute them. """
+	def enumerate_moves(self, allow_freecell = 1, last_move = None):
+		""" List all valid moves but don't execute them. 'last_move' is the move that got us here, defaulting to the end of the move history. """
 
 		valid_moves = []
+		if last_move is None and len(self.move_history):
+			last_move = self.move_history[-1]
+
+		# Only worth finding once, not once per destination
+		first_free_cell = self.first_free_cell()
 
 		# Check moves from every cell to every cell using a nested loop. The i iterator will be
 		# the destination and the j iterator the origin.
@@ -298,7 +663,7 @@ class Game:
 				continue
 
 			# Don't bother checking moves to free cell other than the first open freecell.
-			if self.stacks[i].type == "freecell" and i != self.first_free_cell():
+			if self.stacks[i].type == "freecell" and i != first_free_cell:
 				continue
 
 			# Override built in to disable moves to free cells, not actually used.
@@ -312,7 +677,7 @@ class Game:
 					continue
 
 				# Don't just undo the previous move (the state iterator in global_solve should prevent this anyway)
-				if len(self.move_history) and self.move_history[-1] == (i, j):
+				if last_move == (i, j):
 					continue
 
 				# Valid moves
@@ -377,8 +742,20 @@ class Game:
 		# Hand back the same move set with numbers of cards attached for whatever reason
 		return fixed_moves
 
-	def global_solve(self, print_level = 0):
-		""" Greedy hill-climber queue search to solve the game. """
+	def global_solve(self, print_level = 0, debug = 0, strategy = "greedy", heuristic = "score", weight = 1.0, beam_width = 100, prune = DEFAULT_PRUNING, portfolio = 0, workers = 0, cache = None, timing = 0, callback = None,
+		time_limit = 0, max_nodes = 0, max_memory = 0, optimize = 1, optimize_depth = 0):
+		""" Search for a solution and play it. The default strategy is the original greedy hill-climber; see STRATEGIES,
+		HEURISTICS and PRUNING_RULES for the options. 'debug' cross-checks the incremental hash and score against full
+		recomputation. With 'portfolio' above 1, that many processes race different strategies on the game and the
+		first solution that replays correctly wins. 'workers' is the process count for the parallel strategy. With a
+		SolutionCache as 'cache', a game it already knows skips the search, and new solutions are added to it.
+		'timing' and 'callback' switch on the search's instrumentation (see Search.stats); with timing on, the stats
+		are printed at the end, and either way they're kept in self.stats. 'time_limit' (seconds), 'max_nodes' and
+		'max_memory' (megabytes) bound the search, 0 meaning no limit. Unless 'optimize' is off, a solution the
+		search finds is shortened by optimize_solution, looking 'optimize_depth' moves ahead.
+
+		Returns the played moves, or None without a solution. self.result is a SolveResult saying which way it went,
+		and how far the search got if it didn't solve the game. """
 
 		# Because this isn't recursive, only the top level should call this
 		if self.depth > 0:
@@ -387,122 +764,1434 @@ class Game:
 		begin = timer()
 		print("Solving game...")
 
-		# Record previously visited game states to avoid loops
-		visited_nodes = []
+		options = {"heuristic": heuristic, "max_depth": self.max_depth, "debug": debug, "weight": weight, "beam_width": beam_width, "prune": prune, "workers": workers, "timing": timing,
+			"time_limit": time_limit, "max_nodes": max_nodes, "max_memory": max_memory}
+		board = self.board()
+		moves = cache.get(board) if cache is not None else None
+		self.stats = None
+		if moves is not None:
+			print("Found in the solution cache.")
+			nodes_expanded = 0
+			self.result = SolveResult("solved", moves, play_moves(board, moves), None)
+		elif portfolio > 1:
+			# The racers are other processes, so there's nobody to call back; only the node count comes back
+			self.result, nodes_expanded = portfolio_solve(board, portfolio, strategy, options, self.check_solution, print_level)
+			moves = self.result.moves if self.result.status == "solved" else None
+		else:
+			searcher = STRATEGIES[strategy](print_level = print_level, callback = callback, **options)
+			self.result = searcher.solve(board)
+			moves = self.result.moves if self.result.status == "solved" else None
+			nodes_expanded = searcher.nodes_expanded
+			self.stats = self.result.stats
+			if timing:
+				print_stats(self.stats)
+
+		# Every move is a mouse drag in the GUI, so it's worth trimming what the search came up with
+		if optimize and moves is not None and nodes_expanded:
+			shorter = optimize_solution(board, moves, optimize_depth)
+			if len(shorter) < len(moves):
+				print("Optimized the solution from %d to %d moves" % (len(moves), len(shorter)))
+				moves = shorter
+				self.result.moves = moves
+
+		if cache is not None and moves is not None and nodes_expanded:
+			cache.put(board, moves)
+
+		# Keep the search statistics around so callers can compare runs
+		self.nodes_expanded = nodes_expanded
+		self.solve_time = timer() - begin
+		print("Expanded %d nodes in %.2f seconds (%.0f nodes/sec)" % (self.nodes_expanded, self.solve_time, self.nodes_expanded / max(self.solve_time, 1e-9)))
+
+		# Note to the user it's not solvable, or that we didn't get far enough to tell
+		if moves is None:
+			if self.result.status == "unsolvable":
+				print("Game cannot be solved.")
+			elif self.result.status == "budget":
+				print("Out of budget. Best board scored %d after %d moves." % (self.result.best.score, len(self.result.moves)))
+			else:
+				print("No solution found.")
+			return
+
+		print("Game complete in %d moves. Time elapsed %.2f seconds" % (len(moves), round(self.solve_time, 2)))
+		return self.play_game(moves, print_level)
+
+	def check_solution(self, moves):
+		""" Does this move list really solve the game? Replays it through play_game on a copy. """
+		game = copy.deepcopy(self)
+		try:
+			game.play_game(moves, -1)
+		except Exception:
+			return 0
+
+		return game.is_complete()
 
-		# deque is an efficient fifo data structure, but this might not actually matter given we're re-sorting the queue later.
-		nodes_to_visit = deque([self])
+def heuristic_score(board):
+	""" The original hill-climbing points, negated so lower is better. Not a move count, so weight it down for A*. """
+	return -board.score
+
+def heuristic_collapse(board):
+	""" Card types still to collapse. Every one needs at least one more move, so this never overestimates. """
+	return board.card_types - sum([1 for c in board.collapsed if c > -1])
+
+# Heuristics estimate how far a board is from solved -- lower is better
+HEURISTICS = {"score": heuristic_score, "collapse": heuristic_collapse}
+
+class SolveResult:
+	""" How a search ended. 'status' is one of:
+	  solved      -- 'moves' solves the game
+	  unsolvable  -- the search ran out of moves, which proves no solution exists
+	  budget      -- a time, node or memory budget ran out first
+	  not_found   -- the search gave up without proving anything (beam search, collapse pruning, or the max_depth cap cut it short)
+	Unless it's solved, 'moves' lead to 'best', the highest scoring board the search expanded. 'stats' is
+	Search.stats(). """
+
+	def __init__(self, status, moves, best, stats):
+		self.status = status
+		self.moves = moves
+		self.best = best
+		self.stats = stats
+
+	def __str__(self):
+		if self.status == "solved":
+			return "solved in %d moves" % len(self.moves)
+		return "%s, best board scored %d after %d moves" % (self.status, self.best.score, len(self.moves))
 
-		# These are mostly about print outputs -- 
+class Search:
+	""" Base class for the solver's search strategies. A strategy takes a Board and returns the list of moves that
+	solves it, or None. Whatever it does, it leaves the board the way it found it. """
+
+	# Does running out of moves prove the deal can't be solved? Not for strategies that throw boards away.
+	complete = 1
+
+	def __init__(self, heuristic = "score", max_depth = 75, print_level = -1, debug = 0, weight = 1.0, beam_width = 100, max_nodes = 0, prune = DEFAULT_PRUNING, time_limit = 0, tie_seed = None, workers = 0,
+		timing = 0, callback = None, callback_every = 1000, max_memory = 0):
+		self.heuristic = HEURISTICS[heuristic]
+		self.heuristic_name = heuristic
+		self.max_depth = max_depth
+		self.print_level = print_level
+		self.debug = debug
+		self.weight = weight
+		self.beam_width = beam_width
+		self.max_nodes = max_nodes
+		self.time_limit = time_limit
+		self.max_memory = max_memory
+		self.workers = workers
+		self.prune = prune
+		self.nodes_expanded = 0
+		self.begin = timer()
+		self.budget_exceeded = 0
+		self.next_check = 0
+
+		# What the strategy is holding on to, for the memory budget. Strategies point these at their own containers.
+		self.frontier = ()
+		self.visited = ()
+
+		# The highest scoring board expanded so far, as its state id in 'parents' / 'parent_moves' (see
+		# rebuild_moves), for strategies with a parent table, or as a move list otherwise. Whether the max_depth cap
+		# ever cut the search short, since then running out of moves doesn't prove anything.
+		self.best_score = -1
+		self.best_state = 0
+		self.best_moves = []
+		self.parents = None
+		self.parent_moves = None
+		self.depth_cutoff = 0
+
+		# Ties between equally good boards go first-come-first-served, or randomly with a 'tie_seed' so that parallel
+		# searches of the same deal head off in different directions
+		if tie_seed is None:
+			self.tie_breaker = itertools.count().__next__
+		else:
+			self.tie_breaker = random.Random(tie_seed).random
+
+		for rule in prune:
+			if rule not in PRUNING_RULES:
+				raise Exception("Unknown pruning rule %s" % rule)
+		self.prune_empty = "empty" in prune
+		self.prune_pointless = "pointless" in prune
+		self.prune_transpositions = "transposition" in prune
+		self.prune_collapse = "collapse" in prune
+
+		# How many children we generated, and how many moves each rule cut
+		self.children_generated = 0
+		self.pruned = dict([(rule, 0) for rule in PRUNING_RULES])
+		self.duplicates = 0
+		self.frontier_peak = 0
+		self.done = 0
+
+		# Instrumentation. 'callback' gets stats() every 'callback_every' nodes and once more at the end. With
+		# 'timing' on, the time spent in each phase (see PHASES) is added up, by swapping timed wrappers in for the
+		# functions the search loops call. With it off the loops call the plain functions, so it costs nothing.
+		self.callback = callback
+		self.callback_every = callback_every
+		self.last_report = 0
+		self.timing = timing
+		self.phase_times = dict([(phase, 0.0) for phase in PHASES])
+		if timing:
+			self.generate_moves = self.timed(self.generate_moves, "movegen")
+			self.heuristic = self.timed(self.heuristic, "heuristic")
+
+	def search(self, board):
+		raise NotImplementedError
+
+	def timed(self, function, phase):
+		""" Wrap 'function' so the time spent in it is added to 'phase'. """
+		phase_times = self.phase_times
+
+		def timed_function(*args):
+			begin = timer()
+			result = function(*args)
+			phase_times[phase] += timer() - begin
+			return result
+
+		return timed_function
+
+	def board_methods(self, board):
+		""" The board's make_move, unmake_move, pack and unpack, timed if timing is on. The search loops hold these
+		in locals rather than going through the board. """
+		if not self.timing:
+			return board.make_move, board.unmake_move, board.pack, board.unpack
+
+		return (self.timed(board.make_move, "move"), self.timed(board.unmake_move, "move"), self.timed(board.pack, "copy"),
+			self.timed(board.unpack, "copy"))
+
+	def stats(self):
+		""" Counters and timings for the search so far, as a dict:
+		  nodes_expanded, children_generated -- boards expanded, and children queued (after pruning)
+		  duplicates     -- boards thrown away on reaching them because the search had already been there
+		  frontier_peak  -- most boards waiting at once (the frontier, the beam layer, or the IDA* path)
+		  pruned         -- moves each pruning rule cut
+		  phases         -- seconds spent in each of PHASES, if timing is on
+		  seconds, done  -- time since the search started, and whether it has finished """
+		return {"nodes_expanded": self.nodes_expanded, "children_generated": self.children_generated, "duplicates": self.duplicates,
+			"frontier_peak": self.frontier_peak, "pruned": dict(self.pruned), "phases": dict(self.phase_times),
+			"seconds": timer() - self.begin, "done": self.done}
+
+	def finish(self, result):
+		""" Every strategy's search returns through here, to give the callback its last report. """
+		self.done = 1
+		if self.callback is not None:
+			self.callback(self.stats())
+		return result
+
+	def memory_used(self):
+		""" Rough bytes held by the frontier and the visited boards. """
+		return len(self.frontier) * FRONTIER_BYTES + len(self.visited) * VISITED_BYTES
+
+	def best_prefix(self):
+		""" Moves from the start to the highest scoring board expanded. """
+		if self.parents is not None:
+			return rebuild_moves(self.parents, self.parent_moves, self.best_state) if len(self.parents) else []
+		return list(self.best_moves)
+
+	def solve(self, board):
+		""" search(), wrapped up as a SolveResult that says why it stopped and, if it didn't find a solution, how
+		far it got. """
+		moves = self.search(board)
+		if moves is not None:
+			status = "solved"
+			moves = list(moves)
+		elif self.budget_exceeded:
+			status = "budget"
+		elif self.complete and not self.depth_cutoff and not self.prune_collapse:
+			# Collapse pruning can throw away the only way through, so running out of moves proves nothing with it on
+			status = "unsolvable"
+		else:
+			status = "not_found"
+
+		if moves is None:
+			moves = self.best_prefix()
+		return SolveResult(status, moves, play_moves(board, moves), self.stats())
+
+	def generate_moves(self, board, last_move):
+		""" The board's valid moves, minus whatever the enabled pruning rules drop. """
+		valid_moves = board.enumerate_moves(last_move)
+		if not (self.prune_empty or self.prune_pointless or self.prune_collapse):
+			return valid_moves
+
+		cards = board.cards
+		freecell = board.freecell
+		first_empty = -1
+		if self.prune_empty:
+			for i in range(len(cards)):
+				if not cards[i] and not freecell[i] and not board.locked[i]:
+					first_empty = i
+					break
+
+		moves = []
+		for move in valid_moves:
+			i, j = move
+			if not cards[j] and not freecell[j]:
+				if self.prune_empty and j != first_empty:
+					self.pruned["empty"] += 1
+					continue
+				if self.prune_pointless and not freecell[i] and board.runs[i] == len(cards[i]):
+					self.pruned["pointless"] += 1
+					continue
+			elif self.prune_pointless and freecell[i] and freecell[j]:
+				self.pruned["pointless"] += 1
+				continue
+			moves.append(move)
+
+		if self.prune_collapse:
+			collapses = [move for move in moves if board.move_collapses(move)]
+			if collapses:
+				self.pruned["collapse"] += len(moves) - len(collapses)
+				moves = collapses
+
+		return moves
+
+	def out_of_budget(self):
+		""" Node, time and memory budgets (max_memory is in megabytes), so a bad deal can't hang the GUI or stall a
+		batch. 0 is unlimited. The clock and memory are only looked at every 256 nodes. Once a budget runs out it
+		stays out, and budget_exceeded says so. Every strategy calls this as it goes, so it's also where the callback
+		gets its progress reports. """
+		if self.callback is not None and self.nodes_expanded - self.last_report >= self.callback_every:
+			self.last_report = self.nodes_expanded
+			self.callback(self.stats())
+
+		if not self.budget_exceeded:
+			if self.max_nodes and self.nodes_expanded >= self.max_nodes:
+				self.budget_exceeded = 1
+			elif self.nodes_expanded >= self.next_check:
+				# Strategies that expand a layer or a batch at a time skip past node counts, hence not "every 256th"
+				self.next_check = self.nodes_expanded + 256
+				if self.time_limit and timer() - self.begin > self.time_limit:
+					self.budget_exceeded = 1
+				elif self.max_memory and self.memory_used() > self.max_memory * 1048576:
+					self.budget_exceeded = 1
+
+		return self.budget_exceeded
+
+	def check(self, board, move):
+		""" Debug cross-check of the board's incremental bookkeeping after a move. """
+		if board.zobrist != board.compute_zobrist() or board.score != board.compute_score():
+			raise Exception("Incremental hash or score out of step after move %s" % str(move))
+
+class BestFirstSearch(Search):
+	""" Pop the best node from a heap, push its children, repeat. Subclasses decide what "best" means. """
+
+	def priority(self, h, depth):
+		raise NotImplementedError
+
+	def search(self, board):
+		self.begin = timer()
+
+		# Record previously visited game states to avoid loops, by their Zobrist hash. A set makes the membership
+		# check constant time. In debug mode we also remember the full key behind each hash to catch collisions.
+		visited_nodes = set()
+		debug_keys = {}
+
+		# Rather than copying the game for every child, the search moves one compact Board around with make_move and
+		# unmake_move. Frontier entries only hold the packed state, the id of the state they came from and the move
+		# that got them here.
+		root = board.pack()
+
+		# Every visited state gets an id, which indexes these two flat arrays: where the state came from, and the
+		# move (packed as origin * 256 + destination) that got it there. The move list is only rebuilt at the end.
+		parents = array("i")
+		parent_moves = array("H")
+		self.parents = parents
+		self.parent_moves = parent_moves
+
+		# The frontier is a heap ordered by priority, then the tie-breaker. By default that's insertion order, so
+		# equal nodes come out first-in-first-out, the same order the old re-sorted deque gave us.
+		tie_breaker = self.tie_breaker
+		heuristic = self.heuristic
+		make_move, unmake_move, pack, unpack = self.board_methods(board)
+		nodes_to_visit = [(self.priority(heuristic(board), 0), tie_breaker(), 0, board.zobrist, root, -1, 0)]
+		self.frontier = nodes_to_visit
+		self.visited = visited_nodes
+
+		# These are mostly about print outputs --
 		max_depth = 0
 		max_score = 0
-		i = 0
-		done = 0
+		result = None
 
 		# Let's just go through the queue
-		while nodes_to_visit:
-			current = nodes_to_visit.popleft()
+		while nodes_to_visit and not self.out_of_budget():
+			if len(nodes_to_visit) > self.frontier_peak:
+				self.frontier_peak = len(nodes_to_visit)
+			_, _, depth, zobrist, packed, parent, move_code = heapq.heappop(nodes_to_visit)
 
 			# Have we already been to the state we're trying to go to?
-			hash = current.hash()
-			if hash in visited_nodes:
+			if zobrist in visited_nodes:
+				if self.debug and debug_keys[zobrist] != b"".join(sorted(split_packed(packed))):
+					raise Exception("Zobrist hash collision")
+				self.duplicates += 1
 				continue
 
-			# Print anything?
-			if print_level > -1 and (current.get_score() > max_score or current.depth > max_depth or print_level == 2):
-				print("%d [D%d L%d]: %s. Score: %d" % (i, current.depth, len(nodes_to_visit), current.hash(), current.get_score()))
-				max_depth = max(max_depth, current.depth)
-				max_score = max(max_score, current.get_score())
+			# Mark this new state as having been visited, and move the board there
+			visited_nodes.add(zobrist)
+			state_id = len(parents)
+			parents.append(parent)
+			parent_moves.append(move_code)
+			unpack(packed)
+			if self.debug:
+				debug_keys[zobrist] = board.state_key()
 
-			# Mark this new state as having been visited
-			visited_nodes.append(current.hash())
+			# Print anything?
+			if self.print_level > -1 and (board.score > max_score or depth > max_depth or self.print_level == 2):
+				print("%d [D%d L%d]: %s. Score: %d" % (self.nodes_expanded, depth, len(nodes_to_visit), board.hash(), board.score))
+				max_depth = max(max_depth, depth)
+				max_score = max(max_score, board.score)
 
 			# Are we done here?
-			if current.is_complete():
-				end = timer()
-				print("Game complete in %d moves. Time elapsed %.2f seconds" % (len(current.move_history), round(end - begin, 2)))
-				result_moves = self.play_game(current.move_history, print_level)
-				done = 1
+			if board.is_complete():
+				result = rebuild_moves(parents, parent_moves, state_id)
 				break
-			
-			# If not, let's play -- what are my current descendents?
-			results = current.solve()
-			if results is not None:
-				# Add the current descendents to the queue
-				nodes_to_visit.extend(results)
-
-				# Cheat by sorting -- greedy hill climb
-				nodes_to_visit = deque(sorted(nodes_to_visit, key = lambda k: -k.get_score()))
-			i += 1
-
-		# Note to the user it's not solvable
-		if not done:
-			print("Game cannot be solved.")
-			return
 
-		return result_moves
+			# Remember the best board yet, in case we run out of budget
+			if board.score > self.best_score:
+				self.best_score = board.score
+				self.best_state = state_id
 
-	def solve(self):
-		""" Ask the current game state for its immediate children. """
-
-		# Soft cap on complexity. This typically doesn't get invoked.
-		if self.depth > self.max_depth:
-			return None
-
-		# If it's complete the global solver should have noticed
-		if self.is_complete():
-			raise Exception("Trying to solve complete game.")
+			# Soft cap on complexity. This typically doesn't get invoked.
+			self.nodes_expanded += 1
+			if depth > self.max_depth:
+				self.depth_cutoff = 1
+				continue
 
-		# No moves? Die.
-		if self.is_dead() and self.depth > 0:
-			return None
+			# If not, let's play -- what are my current descendents? Score each child and step straight back.
+			last_move = divmod(move_code, 256) if parent > -1 else None
+			for move in self.generate_moves(board, last_move):
+				undo = make_move(move)
+				if self.debug:
+					self.check(board, move)
+				if self.prune_transpositions and board.zobrist in visited_nodes:
+					self.pruned["transposition"] += 1
+					unmake_move(undo)
+					continue
+				self.children_generated += 1
+				heapq.heappush(nodes_to_visit, (self.priority(heuristic(board), depth + 1), tie_breaker(), depth + 1, board.zobrist, pack(), state_id, move[0] * 256 + move[1]))
+				unmake_move(undo)
+
+		board.unpack(root)
+		return self.finish(result)
+
+class GreedySearch(BestFirstSearch):
+	""" Greedy hill climb: always expand the node that looks best, shallowest first on ties. The original solver. """
+
+	def priority(self, h, depth):
+		return (h, depth)
+
+class WeightedAStarSearch(BestFirstSearch):
+	""" Weighted A*: moves made so far plus 'weight' times the heuristic. Weight 1 with an admissible heuristic
+	finds shortest solutions; bigger weights trade length for speed. """
+
+	def priority(self, h, depth):
+		return (depth + self.weight * h, h)
+
+class BeamSearch(Search):
+	""" Breadth-first, one move at a time, but only the best 'beam_width' boards of each layer survive. Memory is
+	bounded by width times depth. Not complete: a solvable deal can fall out of the beam. """
+
+	complete = 0
+
+	def search(self, board):
+		self.begin = timer()
+		root = board.pack()
+		if board.is_complete():
+			return self.finish([])
+
+		visited_nodes = set([board.zobrist])
+		parents = array("i", [-1])
+		parent_moves = array("H", [0])
+		self.parents = parents
+		self.parent_moves = parent_moves
+		self.visited = visited_nodes
+		tie_breaker = self.tie_breaker
+		heuristic = self.heuristic
+		make_move, unmake_move, pack, unpack = self.board_methods(board)
+
+		# Each layer entry: (heuristic, tie-break, packed board, state id)
+		layer = [(heuristic(board), tie_breaker(), root, 0)]
+		result = None
+		for depth in range(self.max_depth + 1):
+			children = []
+			self.frontier = children
+			self.frontier_peak = max(self.frontier_peak, len(layer))
+			for _, _, packed, state_id in layer:
+				unpack(packed)
+				self.nodes_expanded += 1
+				if board.score > self.best_score:
+					self.best_score = board.score
+					self.best_state = state_id
+				last_move = divmod(parent_moves[state_id], 256) if state_id else None
+				for move in self.generate_moves(board, last_move):
+					undo = make_move(move)
+					if self.debug:
+						self.check(board, move)
+					# Beam search always has to drop boards it has seen, or the beam fills up with repeats
+					if board.zobrist in visited_nodes:
+						self.pruned["transposition"] += 1
+					else:
+						self.children_generated += 1
+						visited_nodes.add(board.zobrist)
+						if board.is_complete():
+							parents.append(state_id)
+							parent_moves.append(move[0] * 256 + move[1])
+							result = rebuild_moves(parents, parent_moves, len(parents) - 1)
+							unmake_move(undo)
+							board.unpack(root)
+							return self.finish(result)
+						children.append((heuristic(board), tie_breaker(), pack(), state_id, move[0] * 256 + move[1]))
+					unmake_move(undo)
+
+			if not children or self.out_of_budget():
+				break
 
-		# Get ready to store the children
-		results = []
-		valid_moves = self.enumerate_moves()
+			# Keep the best of the layer; only the survivors get a row in the parent table
+			layer = []
+			for h, tie, packed, parent, move_code in heapq.nsmallest(self.beam_width, children):
+				parents.append(parent)
+				parent_moves.append(move_code)
+				layer.append((h, tie, packed, len(parents) - 1))
+
+			if self.print_level > -1:
+				print("Depth %d: %d children, best %s" % (depth + 1, len(children), str(layer[0][0])))
+
+		board.unpack(root)
+		return self.finish(result)
+
+class IDAStarSearch(Search):
+	""" Iterative deepening A*: depth-first search on the one board, cut off once moves made plus 'weight' times the
+	heuristic passes a bound, with the bound raised each round to the smallest value that was cut off. Memory is
+	just the current path and a transposition table of the fewest moves each board has been reached in. """
+
+	def search(self, board):
+		self.begin = timer()
+		self.path = []
+		self.make_move, self.unmake_move = self.board_methods(board)[:2]
+		self.table = {}
+		bound = self.weight * self.heuristic(board)
+		while True:
+			# Board hash -> fewest moves we've reached it in this round
+			self.table = {}
+			self.visited = self.table
+			self.next_bound = None
+			if self.visit(board, 0, bound, None):
+				return self.finish(self.path)
+
+			# Nothing was cut off, so we've seen everything reachable
+			if self.next_bound is None or self.out_of_budget():
+				return self.finish(None)
+
+			if self.print_level > -1:
+				print("Bound %s: %d nodes so far" % (str(self.next_bound), self.nodes_expanded))
+			bound = self.next_bound
+
+	def visit(self, board, depth, bound, last_move):
+		""" One step of the depth-first search. True if we found a solution, with the moves left in self.path. """
+		f = depth + self.weight * self.heuristic(board)
+		if f > bound:
+			if self.next_bound is None or f < self.next_bound:
+				self.next_bound = f
+			return False
+
+		if board.is_complete():
+			return True
+
+		# Been here before in as few moves? Then there's nothing new below
+		if self.table.get(board.zobrist, depth + 1) <= depth:
+			self.duplicates += 1
+			return False
+		if depth > self.max_depth:
+			self.depth_cutoff = 1
+			return False
+		if self.out_of_budget():
+			return False
+		self.table[board.zobrist] = depth
+		self.nodes_expanded += 1
+		if board.score > self.best_score:
+			self.best_score = board.score
+			self.best_moves = list(self.path)
+		self.frontier_peak = max(self.frontier_peak, depth + 1)
+
+		# Try the most promising children first
+		children = []
+		for move in self.generate_moves(board, last_move):
+			undo = self.make_move(move)
+			if self.debug:
+				self.check(board, move)
+			# A child already reached in as few moves would be cut off as soon as we visited it
+			if self.prune_transpositions and self.table.get(board.zobrist, depth + 2) <= depth + 1:
+				self.pruned["transposition"] += 1
+			else:
+				self.children_generated += 1
+				children.append((self.heuristic(board), self.tie_breaker(), move))
+			self.unmake_move(undo)
+		children.sort()
+
+		for _, _, move in children:
+			undo = self.make_move(move)
+			self.path.append(move)
+			found = self.visit(board, depth + 1, bound, move)
+			self.unmake_move(undo)
+			if found:
+				return True
+			self.path.pop()
+
+		return False
+
+def hopeless(board):
+	""" Checks the prover makes before searching. A dealt board can only fail the first, having no legal moves at
+	all; the others catch impossible boards typed into exact_setup. Returns the reason, or None if none of them
+	apply (which proves nothing). """
+	if board.is_complete():
+		return None
+
+	if not board.enumerate_moves():
+		return "no legal moves"
+
+	# Cards only ever leave a locked slot by collapsing, and a stack only locks by collapsing, so a locked slot
+	# still holding loose cards (possible from exact_setup) keeps them for good
+	for i in range(len(board.cards)):
+		if board.locked[i] and board.cards[i]:
+			return "cards stuck in locked slot %d" % i
+
+	# Every card type needs all four copies to collapse, and collapsed ones are gone for good
+	counts = [0] * board.card_types
+	for i in range(len(board.cards)):
+		for card in board.cards[i]:
+			counts[card] += 1
+	for card in range(board.card_types):
+		if card not in board.collapsed and counts[card] != 4:
+			return "%d copies of card %d" % (counts[card], card)
+
+	return None
+
+class ProverSearch(Search):
+	""" Depth-first search over every reachable board, for settling whether a deal can be solved at all. There's
+	no heuristic to compute and no frontier of packed boards, just the current path and the boards seen, and no
+	max_depth cap, so running out of moves proves the deal unsolvable. Boards seen are remembered by state_key()
+	rather than the Zobrist hash, since a hash collision could wrongly cut off the only way to a solution.
+	hopeless() runs first to reject stuck or impossible boards without searching. Moves are tried collapses first,
+	then onto matching cards, then into empty stacks, then freecells, so solvable deals tend to come out quickly
+	too. Solutions aren't short. """
+
+	def order_moves(self, board, last_move):
+		moves = []
+		for move in self.generate_moves(board, last_move):
+			if board.move_collapses(move):
+				rank = 0
+			elif board.freecell[move[1]]:
+				rank = 3
+			else:
+				rank = 1 if board.cards[move[1]] else 2
+			moves.append((rank, move))
+		moves.sort()
+		return iter([move for _, move in moves])
+
+	def search(self, board):
+		self.begin = timer()
+		self.reason = hopeless(board)
+		if board.is_complete():
+			return self.finish([])
+		if self.reason is not None:
+			if self.print_level > -1:
+				print("Unsolvable: %s" % self.reason)
+			return self.finish(None)
+
+		make_move, unmake_move = self.board_methods(board)[:2]
+		visited_nodes = set([board.state_key()])
+		self.visited = visited_nodes
+		path = []
+
+		# Each level of the search: the moves still to try there, and the undo record of the move that got there
+		levels = [(self.order_moves(board, None), None)]
+		self.nodes_expanded = 1
+		result = None
+		while levels and not self.out_of_budget():
+			moves, undo = levels[-1]
+			move = next(moves, None)
+			if move is None:
+				levels.pop()
+				if undo is not None:
+					unmake_move(undo)
+					path.pop()
+				continue
 
-		# Iterate through moves
-		for move in valid_moves:
-			i, j = move
+			child_undo = make_move(move)
+			if self.debug:
+				self.check(board, move)
+			key = board.state_key()
+			if key in visited_nodes:
+				self.pruned["transposition"] += 1
+				unmake_move(child_undo)
+				continue
 
-			# Child is a copy of the current game which we'll modify
-			new_game = copy.deepcopy(self)
+			visited_nodes.add(key)
+			path.append(move)
+			self.children_generated += 1
+			if board.is_complete():
+				result = list(path)
+				unmake_move(child_undo)
+				break
 
-			# When resolving, there are two routes -- move one of stack to freecell, or move all of stack somewhere.
-			if new_game.stacks[j].type == "freecell" and len(new_game.stacks[i].which_cards_moving()) > 1 and len(new_game.stacks[i].which_cards_moving()) < 4:
-				cards_move = new_game.stacks[i].resolve_move_from(1)
+			self.nodes_expanded += 1
+			if board.score > self.best_score:
+				self.best_score = board.score
+				self.best_moves = list(path)
+			levels.append((self.order_moves(board, move), child_undo))
+			if len(levels) > self.frontier_peak:
+				self.frontier_peak = len(levels)
+
+		# Back out whatever is left of the path, if we stopped early
+		for _, undo in reversed(levels):
+			if undo is not None:
+				unmake_move(undo)
+
+		if result is None and not self.budget_exceeded and self.reason is None and not self.prune_collapse:
+			self.reason = "searched all %d reachable boards" % len(visited_nodes)
+		if self.print_level > -1 and self.reason is not None:
+			print("Unsolvable: %s" % self.reason)
+		return self.finish(result)
+
+class SharedStateTable:
+	""" A set of 64-bit board hashes in shared memory that several processes can see. It's an open-addressing table
+	split into groups: a hash always lives in the group its low bits pick, and probes linearly within that group.
+	Each group has a single writer (ParallelSearch gives every worker the groups of the boards it owns), so inserts
+	don't need locks, and anyone can look a hash up; a lookup racing an insert can miss the hash, but never finds
+	one that isn't there. 0 marks an empty slot, so a hash of 0 is stored as 1. """
+
+	def __init__(self, size = 1 << 22, groups = 256, name = None):
+		self.groups = groups
+		self.group_size = size // groups
+		if name is None:
+			self.memory = shared_memory.SharedMemory(create = True, size = self.group_size * groups * 8)
+			self.owner = 1
+		else:
+			self.memory = shared_memory.SharedMemory(name = name)
+			self.owner = 0
+		self.slots = self.memory.buf.cast("Q")
+
+	def find(self, key):
+		""" (slot index, whether the hash is there): where the hash is, or the empty slot it would go in. """
+		group_size = self.group_size
+		base = (key % self.groups) * group_size
+		slot = (key >> 16) % group_size
+		slots = self.slots
+		for probe in range(group_size):
+			value = slots[base + slot]
+			if value == key or not value:
+				return base + slot, value == key
+			slot += 1
+			if slot == group_size:
+				slot = 0
+
+		raise Exception("Shared state table is full")
+
+	def contains(self, key):
+		""" Is the hash there? Safe from any process. """
+		return self.find(key or 1)[1]
+
+	def insert(self, key):
+		""" Add a hash. True if it's new, False if it was already there. Only the group's writer may call this. """
+		key = key or 1
+		index, found = self.find(key)
+		if not found:
+			self.slots[index] = key
+		return not found
+
+	def close(self):
+		""" Detach, and free the memory if we created it. """
+		self.slots.release()
+		self.memory.close()
+		if self.owner:
+			self.memory.unlink()
+
+# What each ParallelSearch worker reports in the shared counters array, one block of these per worker: batches of
+# children sent to other workers and taken in, nodes expanded, boards on its frontier and in its parent table, and
+# whether it's sitting with nothing to do
+PARALLEL_COUNTERS = ("sent", "received", "nodes", "frontier", "visited", "idle")
+SENT, RECEIVED, NODES, FRONTIER, VISITED, IDLE = range(len(PARALLEL_COUNTERS))
+
+def parallel_worker(index, board, options, table_args, inboxes, replies, counters, stop):
+	""" One ParallelSearch worker process. It owns the boards whose hash modulo the worker count is 'index': they
+	come in on its inbox in batches, are de-duplicated in its groups of the shared table, and wait on its own heap.
+	It expands its best few at a time and sends each child to the worker that owns it, skipping children the
+	shared table already has. A solved child is reported on 'replies' straight away. Once 'stop' is set, it reports
+	its stats on 'replies' and then answers requests for the parent of its boards until it gets None. """
+
+	search = ParallelSearch(**options)
+	table = SharedStateTable(*table_args)
+	workers = len(inboxes)
+	inbox = inboxes[index]
+	base = index * len(PARALLEL_COUNTERS)
+	heuristic = search.heuristic
+	tie_breaker = search.tie_breaker
+
+	# Board hash -> (parent's hash, move code), for every board this worker owns
+	parents = {}
+	frontier = []
+	outgoing = [[] for i in range(workers)]
+	best = (-1, 0)
+
+	def receive(children):
+		for priority, depth, zobrist, packed, parent, move_code in children:
+			if table.insert(zobrist):
+				parents[zobrist] = (parent, move_code)
+				heapq.heappush(frontier, (priority, tie_breaker(), depth, zobrist, packed))
 			else:
-				cards_move = new_game.stacks[i].resolve_move_from(0)
+				search.duplicates += 1
+
+	try:
+		while not stop.value:
+			# Take in whatever the others sent, waiting a moment for it if there's nothing else to do
+			while True:
+				try:
+					message = inbox.get_nowait() if frontier else inbox.get(timeout = 0.01)
+				except queue.Empty:
+					break
+				counters[base + IDLE] = 0
+				counters[base + RECEIVED] += 1
+				receive(message)
+
+			if not frontier:
+				counters[base + IDLE] = 1
+				continue
+			counters[base + IDLE] = 0
+
+			for _ in range(ParallelSearch.batch_per_worker):
+				if not frontier:
+					break
+				_, _, depth, zobrist, packed = heapq.heappop(frontier)
+				board.unpack(packed)
+				search.nodes_expanded += 1
+				if board.score > best[0]:
+					best = (board.score, zobrist)
+				if depth > search.max_depth:
+					search.depth_cutoff = 1
+					continue
 
-			# Run the move
-			unlock_stack = new_game.stacks[j].resolve_move_to(cards_move)
+				parent, move_code = parents[zobrist]
+				last_move = divmod(move_code, 256) if parent is not None else None
+				for move in search.generate_moves(board, last_move):
+					undo = board.make_move(move)
+					child = board.zobrist
+					if board.is_complete():
+						replies.put(("solved", zobrist, move[0] * 256 + move[1]))
+					elif search.prune_transpositions and table.contains(child):
+						search.pruned["transposition"] += 1
+					else:
+						search.children_generated += 1
+						outgoing[child % workers].append((search.priority(heuristic(board), depth + 1), depth + 1, child, board.pack(), zobrist, move[0] * 256 + move[1]))
+					board.unmake_move(undo)
+
+				# Our own children go straight onto our heap, so with one worker this is just greedy
+				receive(outgoing[index])
+				outgoing[index] = []
+
+			# The rest go to their owners, a batch each
+			for owner in range(workers):
+				if outgoing[owner]:
+					inboxes[owner].put(outgoing[owner])
+					counters[base + SENT] += 1
+					outgoing[owner] = []
+
+			counters[base + NODES] = search.nodes_expanded
+			counters[base + FRONTIER] = len(frontier)
+			counters[base + VISITED] = len(parents)
+
+		replies.put(("stats", index, {"nodes_expanded": search.nodes_expanded, "children_generated": search.children_generated,
+			"duplicates": search.duplicates, "pruned": search.pruned, "depth_cutoff": search.depth_cutoff, "best": best}))
+
+		while True:
+			message = inbox.get()
+			if message is None:
+				break
+			if isinstance(message, int):
+				replies.put(("parent",) + parents[message])
+	finally:
+		# Children still queued for other workers don't matter any more; don't wait for them to be read
+		for other in inboxes:
+			other.cancel_join_thread()
+		replies.cancel_join_thread()
+		table.close()
+
+class ParallelSearch(BestFirstSearch):
+	""" Greedy best-first search spread over 'workers' processes, with the frontier split between them by board
+	hash (see parallel_worker). Every worker expands its own best boards, so there's no central frontier to wait
+	on; boards are de-duplicated through a SharedStateTable. This process just watches the shared counters for a
+	solution, the budget, or every worker going idle with nothing in flight, and then walks the parents back
+	across the workers. The order isn't quite greedy's, so node counts differ from GreedySearch. """
+
+	batch_per_worker = 8
+	table_size = 1 << 22
+
+	def priority(self, h, depth):
+		return (h, depth)
+
+	def memory_used(self):
+		return self.frontier_size * FRONTIER_BYTES + self.visited_size * VISITED_BYTES
+
+	def search(self, board):
+		self.begin = timer()
+		self.frontier_size = 0
+		self.visited_size = 0
+		if board.is_complete():
+			return self.finish([])
+
+		workers = self.workers or multiprocessing.cpu_count()
+		table = None
+		inboxes = []
+		processes = []
+		result = None
+		try:
+			table = SharedStateTable(self.table_size, workers * 64)
+			options = {"heuristic": self.heuristic_name, "prune": self.prune, "max_depth": self.max_depth}
+			inboxes = [multiprocessing.Queue() for i in range(workers)]
+			replies = multiprocessing.Queue()
+			counters = multiprocessing.Array("q", workers * len(PARALLEL_COUNTERS), lock = False)
+			stop = multiprocessing.Value("b", 0, lock = False)
+			for i in range(workers):
+				process = multiprocessing.Process(target = parallel_worker, args = (i, board.copy(), options, (self.table_size, table.groups, table.memory.name),
+					inboxes, replies, counters, stop))
+				process.daemon = True
+				process.start()
+				processes.append(process)
+
+			# The root goes to its owner like any other board. It counts as one batch sent.
+			inboxes[board.zobrist % workers].put([(self.priority(self.heuristic(board), 0), 0, board.zobrist, board.pack(), None, 0)])
+			solution = None
+			previous = None
+			while solution is None:
+				try:
+					solution = replies.get(timeout = 0.02)[1:]
+					break
+				except queue.Empty:
+					pass
+
+				snapshot = counters[:]
+				totals = [sum(snapshot[i::len(PARALLEL_COUNTERS)]) for i in range(len(PARALLEL_COUNTERS))]
+				self.nodes_expanded = totals[NODES]
+				self.frontier_size = totals[FRONTIER]
+				self.visited_size = totals[VISITED]
+				self.frontier_peak = max(self.frontier_peak, totals[FRONTIER])
+				if self.out_of_budget():
+					break
+
+				# Nothing left anywhere: every worker idle and every batch sent taken in, twice running
+				if totals[IDLE] == workers and totals[SENT] + 1 == totals[RECEIVED] and snapshot == previous:
+					break
+				previous = snapshot
+
+				if not all([process.is_alive() for process in processes]):
+					raise Exception("A parallel search worker died")
+
+			stop.value = 1
+			best = (-1, 0)
+			self.nodes_expanded = 0
+			for index, stats in self.replies_of("stats", workers, replies, processes):
+				self.nodes_expanded += stats["nodes_expanded"]
+				self.children_generated += stats["children_generated"]
+				self.duplicates += stats["duplicates"]
+				self.depth_cutoff |= stats["depth_cutoff"]
+				for rule in stats["pruned"]:
+					self.pruned[rule] += stats["pruned"][rule]
+				best = max(best, stats["best"])
+
+			if solution is not None:
+				result = self.moves_to(solution[0], inboxes, replies, processes) + [divmod(solution[1], 256)]
+			elif best[0] > -1:
+				self.best_score = best[0]
+				self.best_moves = self.moves_to(best[1], inboxes, replies, processes)
+		finally:
+			for inbox in inboxes:
+				inbox.put(None)
+				inbox.cancel_join_thread()
+			for process in processes:
+				process.join(1)
+				if process.is_alive():
+					process.terminate()
+					process.join()
+			if table is not None:
+				table.close()
+
+		return self.finish(result)
+
+	def replies_of(self, kind, count, replies, processes):
+		""" The next 'count' replies of one kind from the workers, skipping the others (late solutions, say). """
+		found = []
+		while len(found) < count:
+			try:
+				reply = replies.get(timeout = 1)
+			except queue.Empty:
+				if not all([process.is_alive() for process in processes]):
+					raise Exception("A parallel search worker died")
+				continue
+			if reply[0] == kind:
+				found.append(reply[1:])
+
+		return found
+
+	def moves_to(self, zobrist, inboxes, replies, processes):
+		""" The moves from the root to a board, asking whichever worker owns each board along the way for its
+		parent. """
+		moves = []
+		while True:
+			inboxes[zobrist % len(inboxes)].put(zobrist)
+			parent, move_code = self.replies_of("parent", 1, replies, processes)[0]
+			if parent is None:
+				break
+			moves.append(divmod(move_code, 256))
+			zobrist = parent
+
+		moves.reverse()
+		return moves
+
+# Search strategies by name, for global_solve and the command line
+STRATEGIES = {"greedy": GreedySearch, "astar": WeightedAStarSearch, "beam": BeamSearch, "ida": IDAStarSearch, "parallel": ParallelSearch, "prove": ProverSearch}
+
+# Strategies the portfolio solver races against the caller's choice, in order; any workers beyond these run
+# greedy searches with random tie-breaking
+PORTFOLIO = [
+	("astar", {"weight": 0.5}),
+	("beam", {"beam_width": 100}),
+	("greedy", {"heuristic": "collapse"}),
+	("astar", {"weight": 0.2}),
+	("beam", {"beam_width": 500}),
+]
+
+def portfolio_worker(index, board, strategy, options, results):
+	""" One process of the portfolio: run a strategy and report (index, SolveResult, nodes expanded) on the results
+	queue. Always reports, even if the search blows up (with None for the result), so the parent never waits on a
+	dead worker. """
+	searcher = None
+	result = None
+	try:
+		searcher = STRATEGIES[strategy](**options)
+		result = searcher.solve(board)
+	finally:
+		results.put((index, result, searcher.nodes_expanded if searcher is not None else 0))
+
+def portfolio_configs(workers, strategy, options):
+	""" The (strategy, options) each portfolio worker runs. The first is the caller's choice as given. """
+
+	# Portfolio workers are daemon processes, which can't start processes of their own
+	if strategy == "parallel":
+		raise Exception("The parallel strategy can't be used in a portfolio")
+
+	configs = [(strategy, dict(options))]
+	for i in range(1, workers):
+		if i <= len(PORTFOLIO):
+			name, overrides = PORTFOLIO[i - 1]
+		else:
+			name, overrides = "greedy", {"tie_seed": i}
+		config = dict(options)
+		config.update(overrides)
+		configs.append((name, config))
+
+	return configs
+
+def portfolio_solve(board, workers, strategy = "greedy", options = {}, verify = None, print_level = -1):
+	""" Race 'workers' processes, each with a different strategy or tie-break seed, on the same board. The first
+	solution that passes 'verify' (a function of the move list) wins and the other processes are stopped, and so
+	does the first proof that the board is unsolvable. Returns (SolveResult, nodes expanded): the winner's and its
+	node count, or if nobody won, "budget" if any worker ran out of budget (otherwise "not_found") with the best
+	board any of them reached, and the total nodes. The result has no stats, since the workers are gone. """
+
+	results = multiprocessing.Queue()
+	configs = portfolio_configs(workers, strategy, options)
+
+	# Bad options should fail here, like they do without a portfolio, rather than in every worker
+	for name, config in configs:
+		STRATEGIES[name](**config)
+
+	processes = [multiprocessing.Process(target = portfolio_worker, args = (i, board, name, config, results)) for i, (name, config) in enumerate(configs)]
+	for process in processes:
+		process.daemon = True
+		process.start()
+
+	winner = None
+	others = []
+	nodes_expanded = 0
+	stopped = 0
+	reported = 0
+	try:
+		while reported < len(processes):
+			try:
+				index, result, nodes = results.get(timeout = 1)
+			except queue.Empty:
+				# A worker the OS killed never reports. Once every worker has stopped, give the queue one more
+				# second for results still on their way, then stop waiting.
+				if not any([process.is_alive() for process in processes]):
+					if stopped:
+						break
+					stopped = 1
+				continue
 
-			# Let's see if we have any free cells to unlock
-			if unlock_stack:
-				first_locked_empty = new_game.first_locked_empty()
-				if first_locked_empty > -1:
-					new_game.stacks[first_locked_empty].locked = False
+			reported += 1
+			if result is not None and result.status == "solved" and (verify is None or verify(result.moves)):
+				if print_level > -1:
+					print("Portfolio worker %d (%s %s) found a %d move solution first" % (index, configs[index][0], str(configs[index][1]), len(result.moves)))
+				winner = result
+				nodes_expanded = nodes
+				break
 
-			# Now add 1 to child depth, add the move to the move history, pre-bake the score, and add to the list of children
-			new_game.depth = new_game.depth + 1
-			new_game.move_history.append(move)
-			new_game.get_score(1)
-			results.append(new_game)
+			nodes_expanded += nodes
+			if result is not None and result.status == "unsolvable":
+				if print_level > -1:
+					print("Portfolio worker %d (%s %s) proved the game unsolvable" % (index, configs[index][0], str(configs[index][1])))
+				winner = result
+				break
+			if result is not None and result.status != "solved":
+				others.append(result)
+	finally:
+		for process in processes:
+			if process.is_alive():
+				process.terminate()
+			process.join()
+
+	if winner is None:
+		status = "budget" if [r for r in others if r.status == "budget"] else "not_found"
+		best = max(others, key = lambda r: r.best.score) if others else SolveResult(status, [], board.copy(), None)
+		winner = SolveResult(status, best.moves, best.best, None)
+	winner.stats = None
+	return winner, nodes_expanded
+
+class SolutionCache:
+	""" Solutions kept on disk in SQLite, keyed by the canonical hash, so a game we've seen before (a restart, or the
+	same screen captured twice) doesn't get solved again. Every board along a stored solution is indexed too, so a
+	game captured part way through a known solution picks up from there.
+
+	Because the canonical hash sorts the slots, moves are stored against slot positions in that sorted order and
+	mapped back onto the actual slots on the way out. At most 'max_solutions' solutions are kept; the least recently
+	used one goes first. """
+
+	def __init__(self, filename = "solutions.db", max_solutions = 10000):
+		self.max_solutions = max_solutions
+		self.hits = 0
+		self.misses = 0
+		self.db = sqlite3.connect(filename)
+		# WAL without a sync on every commit keeps a hit (one lookup plus one timestamp update) well under a millisecond
+		self.db.execute("PRAGMA journal_mode = WAL")
+		self.db.execute("PRAGMA synchronous = NORMAL")
+		self.db.execute("CREATE TABLE IF NOT EXISTS solutions (root TEXT PRIMARY KEY, last_used INTEGER)")
+		self.db.execute("CREATE TABLE IF NOT EXISTS states (state TEXT PRIMARY KEY, root TEXT, moves BLOB)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS states_root ON states (root)")
+		self.db.commit()
+		self.clock = self.db.execute("SELECT MAX(last_used) FROM solutions").fetchone()[0] or 0
+
+	def __len__(self):
+		return self.db.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+	def close(self):
+		self.db.close()
+
+	def touch(self, root):
+		self.clock += 1
+		self.db.execute("UPDATE solutions SET last_used = ? WHERE root = ?", (self.clock, root))
+
+	def get(self, board):
+		""" The moves that finish 'board' from here, in its own slot numbering, or None if it isn't cached. """
+		order = board.canonical_order()
+		row = self.db.execute("SELECT root, moves FROM states WHERE state = ?", ("".join(["%s/" % board.slot_hash(i) for i in order]),)).fetchone()
+		if row is None:
+			self.misses += 1
+			return None
 
-		# This was a secondary check in case I wanted to limit valid moves in the above iterator, but I ultimately didn't, so this should never happen
-		if self.depth == 0 and not len(results):
-			raise Exception("Impossible to solve game")
+		self.hits += 1
+		self.touch(row[0])
+		self.db.commit()
+		codes = bytearray(row[1])
+		return [(order[codes[k]], order[codes[k + 1]]) for k in range(0, len(codes), 2)]
+
+	def put(self, board, moves):
+		""" Store a solution for 'board', plus what's left of it from every board it passes through. """
+		board = board.copy()
+		root = board.hash()
+		if self.db.execute("SELECT 1 FROM solutions WHERE root = ?", (root,)).fetchone():
+			self.touch(root)
+			self.db.commit()
+			return
 
-		# No results?
-		if not len(results):
+		rows = []
+		for k in range(len(moves) + 1):
+			order = board.canonical_order()
+			position = [0] * len(order)
+			for sorted_position, i in enumerate(order):
+				position[i] = sorted_position
+
+			codes = bytearray()
+			for i, j in moves[k:]:
+				codes += bytearray([position[i], position[j]])
+			rows.append(("".join(["%s/" % board.slot_hash(i) for i in order]), root, bytes(codes)))
+			if k < len(moves):
+				board.make_move(moves[k])
+
+		self.clock += 1
+		self.db.execute("INSERT INTO solutions VALUES (?, ?)", (root, self.clock))
+		# A board another stored solution already passes through keeps the older entry
+		self.db.executemany("INSERT OR IGNORE INTO states VALUES (?, ?, ?)", rows)
+
+		# Evict the least recently used solutions, and every board indexed along them
+		extra = len(self) - self.max_solutions
+		if extra > 0:
+			oldest = [row[0] for row in self.db.execute("SELECT root FROM solutions ORDER BY last_used LIMIT ?", (extra,))]
+			self.db.executemany("DELETE FROM states WHERE root = ?", [(old,) for old in oldest])
+			self.db.executemany("DELETE FROM solutions WHERE root = ?", [(old,) for old in oldest])
+
+		self.db.commit()
+
+def print_stats(stats):
+	""" Human readable version of Search.stats(). """
+	print("Nodes %d, children %d, duplicates %d, frontier peak %d" % (stats["nodes_expanded"], stats["children_generated"], stats["duplicates"], stats["frontier_peak"]))
+	print("Pruned: %s" % ", ".join(["%s %d" % (rule, stats["pruned"][rule]) for rule in PRUNING_RULES]))
+	print("Time: %s of %.3fs" % (", ".join(["%s %.3fs" % (phase, stats["phases"][phase]) for phase in PHASES]), stats["seconds"]))
+
+def play_moves(board, moves):
+	""" A copy of 'board' with 'moves' played on it. """
+	board = board.copy()
+	for move in moves:
+		board.make_move(move)
+	return board
+
+def replays(board, moves):
+	""" Is every move legal in turn, and does the last one finish the game? """
+	board = board.copy()
+	for move in moves:
+		if not board.is_legal(move):
+			return False
+		board.make_move(move)
+	return board.is_complete()
+
+def replay_states(board, moves):
+	""" The board before each move and after the last, as copies. """
+	states = [board.copy()]
+	for move in moves:
+		states.append(states[-1].copy())
+		states[-1].make_move(move)
+	return states
+
+def slot_mapping(source, target):
+	""" For two boards that are the same game with the slots in a different order, which slot of 'target' holds
+	what each slot of 'source' holds. Identical slots pair up in index order. None if they aren't the same game. """
+	slots = {}
+	for i in range(len(target.cards)):
+		slots.setdefault(target.slot_hash(i), []).append(i)
+
+	mapping = []
+	for i in range(len(source.cards)):
+		matches = slots.get(source.slot_hash(i))
+		if not matches:
 			return None
+		mapping.append(matches.pop(0))
+	return mapping
+
+def splice(board, prefix, reached, original, suffix):
+	""" Moves 'prefix' reach 'reached', the same game as 'original' up to slot order; 'suffix' finishes the game
+	from 'original'. Join them up, renumbering the suffix's slots, and return the new solution if it replays. """
+	mapping = slot_mapping(original, reached)
+	if mapping is None:
+		return None
+	moves = prefix + [(mapping[i], mapping[j]) for i, j in suffix]
+	return moves if replays(board, moves) else None
+
+def remove_cycles(board, moves):
+	""" Wherever the solution comes back to a board it has been at before, cut out the loop. Also catches moves
+	that are undone straight away. """
+	changed = True
+	while changed:
+		changed = False
+		states = replay_states(board, moves)
+		last_seen = {}
+		for k, state in enumerate(states):
+			last_seen[state.zobrist] = k
+		for k, state in enumerate(states):
+			later = last_seen[state.zobrist]
+			if later > k:
+				shorter = splice(board, moves[:k], state, states[later], moves[later:])
+				if shorter is not None:
+					moves = shorter
+					changed = True
+					break
+	return moves
+
+def shortcut_freecells(board, moves):
+	""" A card parked in a freecell and later moved on can often go straight there instead, either when it was
+	parked or when it was moved on; a card that goes back where it came from needn't have moved at all. Also drops
+	any single move the solution works without. """
+	changed = True
+	while changed:
+		changed = False
+		states = replay_states(board, moves)
+		for k1, (source, cell) in enumerate(moves):
+			if not states[k1].freecell[cell]:
+				continue
+			k2 = next((k for k in range(k1 + 1, len(moves)) if moves[k][0] == cell), None)
+			if k2 is None:
+				continue
+
+			dest = moves[k2][1]
+			if dest == source:
+				candidates = [moves[:k1] + moves[k1 + 1:k2] + moves[k2 + 1:]]
+			else:
+				candidates = [moves[:k1] + moves[k1 + 1:k2] + [(source, dest)] + moves[k2 + 1:], moves[:k1] + [(source, dest)] + moves[k1 + 1:k2] + moves[k2 + 1:]]
+			for candidate in candidates:
+				if replays(board, candidate):
+					moves = candidate
+					changed = True
+					break
+			if changed:
+				break
 
-		# Results
-		return results
+		if not changed:
+			for k in range(len(moves)):
+				candidate = moves[:k] + moves[k + 1:]
+				if replays(board, candidate):
+					moves = candidate
+					changed = True
+					break
+	return moves
+
+def shortcut_windows(board, moves, depth):
+	""" From each board along the solution, try every sequence of up to 'depth' moves, and if one lands on a board
+	the solution only reaches later in more moves, take the shortcut. """
+	k = 0
+	while k < len(moves):
+		states = replay_states(board, moves)
+		last_seen = {}
+		for later, state in enumerate(states):
+			last_seen[state.zobrist] = later
+
+		# Shortest path found to each board within reach, by depth-first search on one board
+		reached = {}
+		scratch = states[k].copy()
+		path = []
+
+		def explore(level):
+			for move in scratch.enumerate_moves():
+				undo = scratch.make_move(move)
+				path.append(move)
+				if len(path) < len(reached.get(scratch.zobrist, path + [None])):
+					reached[scratch.zobrist] = list(path)
+				if level < depth:
+					explore(level + 1)
+				path.pop()
+				scratch.unmake_move(undo)
+
+		explore(1)
+		shortcuts = sorted([(len(route) - (last_seen[zobrist] - k), last_seen[zobrist], route) for zobrist, route in reached.items()
+			if zobrist in last_seen and last_seen[zobrist] - k > len(route)])
+
+		shorter = None
+		for _, later, route in shortcuts:
+			shorter = splice(board, moves[:k] + route, play_moves(states[k], route), states[later], moves[later:])
+			if shorter is not None:
+				break
+		if shorter is not None:
+			moves = shorter
+		else:
+			k += 1
+	return moves
+
+def optimize_solution(board, moves, depth = 0):
+	""" Shorten a solution for 'board' without searching for a new one: cut out loops, shortcut freecell round
+	trips and drop moves that aren't needed. With 'depth', also look up to that many moves ahead from each board
+	for a quicker way to a later one (3 or so is affordable). Every change is checked by replaying the whole
+	solution, so the result always solves the game; it's 'moves' as given if that doesn't. """
+	moves = list(moves)
+	if not replays(board, moves):
+		return moves
+
+	moves = remove_cycles(board, moves)
+	moves = shortcut_freecells(board, moves)
+	if depth:
+		moves = shortcut_windows(board, moves, depth)
+		moves = shortcut_freecells(board, moves)
+	return moves
+
+def split_packed(packed):
+	""" Break a packed game state back into its per-stack keys, using the length byte in each one. """
+	chunks = []
+	data = bytearray(packed)
+	position = 0
+	while position < len(data):
+		end = position + 2 + data[position + 1]
+		chunks.append(bytes(data[position:end]))
+		position = end
+
+	return chunks
+
+def rebuild_moves(parents, parent_moves, state_id):
+	""" Walk the parent table back from 'state_id' to the root and return the moves in the order they were played. """
+	moves = []
+	while parents[state_id] > -1:
+		moves.append(divmod(parent_moves[state_id], 256))
+		state_id = parents[state_id]
+
+	moves.reverse()
+	return moves
+
+def seeded_game(seed, how_many_free = 1):
+	""" The random deal for 'seed', dealt the same way the command line does it. """
+	game = Game(how_many_free)
+	game.seed(seed)
+	game.deal_cards()
+	return game
+
+def parse_seeds(text):
+	""" Turn a seed range like "0-100" (inclusive) or a single seed like "7" into a range. """
+	first, _, last = text.partition("-")
+	return range(int(first), int(last or first) + 1)
+
+def add_solver_arguments(parser):
+	""" Command line options for picking a search strategy; shared with eliza_gui and eliza_bench. """
+	parser.add_argument("--strategy", choices = sorted(STRATEGIES), default = "greedy", help = "search strategy (default: greedy); prove searches every reachable board, so it can prove a deal unsolvable")
+	parser.add_argument("--heuristic", choices = sorted(HEURISTICS), default = "score", help = "heuristic the strategy ranks boards by (default: score)")
+	parser.add_argument("--weight", type = float, default = 1.0, help = "heuristic weight for astar and ida (default: 1.0)")
+	parser.add_argument("--beam-width", type = int, default = 100, help = "boards kept per layer for beam (default: 100)")
+	parser.add_argument("--portfolio", type = int, default = 0, metavar = "N", help = "race N processes running different strategies, first solution wins (default: off)")
+	parser.add_argument("--parallel-workers", type = int, default = 0, metavar = "N", help = "processes for the parallel strategy (default: one per core)")
+	parser.add_argument("--time-limit", type = float, default = 0, metavar = "SECONDS", help = "give up on a game after this long (default: no limit)")
+	parser.add_argument("--max-nodes", type = int, default = 0, help = "give up on a game after expanding this many boards (default: no limit)")
+	parser.add_argument("--max-memory", type = float, default = 0, metavar = "MB", help = "give up on a game once the search holds about this much memory (default: no limit)")
+	parser.add_argument("--no-optimize", action = "store_true", help = "play the solution as the search found it, without shortening it")
+	parser.add_argument("--optimize-depth", type = int, default = 0, metavar = "N", help = "when shortening a solution, also look for shortcuts up to N moves long (default: 0, 3 is affordable)")
+	parser.add_argument("--stats", action = "store_true", help = "time each phase of the search and print the search statistics")
+	parser.add_argument("--cache", metavar = "FILE", help = "SQLite file of known solutions to check first and add to (default: none)")
+	parser.add_argument("--prune", default = ",".join(DEFAULT_PRUNING), help = "comma separated pruning rules out of %s, or none (default: %s)" % (", ".join(PRUNING_RULES), ",".join(DEFAULT_PRUNING)))
+
+def parse_pruning(text):
+	""" Turn "empty,pointless" or "none" into a tuple of pruning rules. """
+	return tuple([rule for rule in text.split(",") if rule and rule != "none"])
+
+def solver_options(args):
+	""" The global_solve keyword arguments matching add_solver_arguments. """
+	return {"strategy": args.strategy, "heuristic": args.heuristic, "weight": args.weight, "beam_width": args.beam_width, "prune": parse_pruning(args.prune), "portfolio": args.portfolio, "workers": args.parallel_workers,
+		"cache": SolutionCache(args.cache) if args.cache else None, "timing": 1 if args.stats else 0,
+		"time_limit": args.time_limit, "max_nodes": args.max_nodes, "max_memory": args.max_memory, "optimize": 0 if args.no_optimize else 1,
+		"optimize_depth": args.optimize_depth}
+
+def solve_seeds(seeds, print_level = -1, **options):
+	""" Solve a batch of seeded random deals and summarise how fast the solver chewed through them. 'options' go to global_solve. """
+
+	total_nodes = 0
+	total_time = 0.0
+	solved = 0
+	for seed in seeds:
+		game = seeded_game(seed)
+		result = game.global_solve(print_level, **options)
+
+		total_nodes += game.nodes_expanded
+		total_time += game.solve_time
+		solved += result is not None
+		print("Seed %d: %s, %d nodes, %.2f seconds" % (seed, "%d moves" % len(result) if result is not None else game.result.status, game.nodes_expanded, game.solve_time))
+
+	print("%d/%d deals solved. %d nodes in %.2f seconds (%.0f nodes/sec)" % (solved, len(seeds), total_nodes, total_time, total_nodes / max(total_time, 1e-9)))
 
 # What do we do if this is executed directly?			
 if __name__ == "__main__":
-	my_game = Game(1)
-	my_game.deal_cards()
-	print(my_game)
-	my_game.global_solve(0)
\ No newline at end of file
+	parser = argparse.ArgumentParser(description = "Solve a random Eliza solitaire game, or a batch of seeded ones.")
+	parser.add_argument("seeds", nargs = "?", help = "seed range like 0-100 to solve a batch of seeded deals")
+	add_solver_arguments(parser)
+	args = parser.parse_args()
+
+	if args.seeds:
+		solve_seeds(parse_seeds(args.seeds), **solver_options(args))
+	else:
+		my_game = Game(1)
+		my_game.deal_cards()
+		print(my_game)
+		my_game.global_solve(0, **solver_options(args))
@@ -0,0 +1,36 @@
+import random
+import pytest
+import eliza_logic
+
+@pytest.mark.parametrize("seed", range(20))
+def test_incremental_bookkeeping(seed):
+	""" Play random legal moves (with random numbers of unlocked freecells) on a seeded deal, and after every move
+	and every undo compare the Board's incremental hash, run lengths and score with full recomputation, and its
+	moves and score with Game.enumerate_moves and Game.get_score on the same position. """
+
+	chooser = random.Random(seed)
+	game = eliza_logic.Game(chooser.randint(0, 4))
+	game.seed(seed)
+	game.deal_cards()
+	board = game.board()
+
+	history = []
+	for step in range(100):
+		# Mostly go forward, sometimes back up, so unmake_move gets exercised mid-game too
+		valid_moves = board.enumerate_moves()
+		if history and (not valid_moves or chooser.random() < 0.2):
+			packed, undo = history.pop()
+			board.unmake_move(undo)
+			assert board.pack() == packed, "step %d: undo didn't restore the board" % step
+		elif valid_moves:
+			packed = board.pack()
+			history.append((packed, board.make_move(chooser.choice(valid_moves))))
+		else:
+			break
+
+		game.load_board(board)
+		last_move = history[-1][1][:2] if history else None
+		assert board.enumerate_moves(last_move) == game.enumerate_moves(last_move = last_move), "step %d" % step
+		assert board.runs == [board.run_length(i) if board.cards[i] else 0 for i in range(len(board.cards))], "step %d" % step
+		assert board.zobrist == board.compute_zobrist(), "step %d" % step
+		assert board.score == board.compute_score() == game.get_score(1), "step %d" % step